@@ -0,0 +1,324 @@
+import json
+import os
+import re
+import traceback
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from time import perf_counter
+
+import dotenv
+import numpy as np
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.utils import save_columns, set_tensorflow_threads
+
+dotenv.load_dotenv()
+
+initial_cash = 1000
+initial_bet = 100
+
+
+def ticker_dir(base, ticker):
+    path = os.path.join(base, re.sub(r"[^\w.-]", "_", ticker))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _init_worker(threads):
+    set_tensorflow_threads(threads)
+
+
+def _evaluate(ticker, pre, y_pred, logs_dir):
+    from alstm_stock_market.src.manager.manager import Manager
+    from alstm_stock_market.src.manager.strategies import default_strategies
+    from alstm_stock_market.src.model.evaluator import Evaluator
+
+    os.environ["LOGS"] = ticker_dir(logs_dir, ticker)
+
+    evaluator = Evaluator(pre.y_test, y_pred, normalizer=pre.normalizer)
+    evaluator.run()
+
+    manager = Manager(
+        initial_cash, initial_bet, evaluator.y_pred_trend, evaluator.y_return
+    )
+    results = manager.run_all(default_strategies(initial_cash, initial_bet))
+
+    return {
+        **evaluator.metrics,
+        "hit_rate": np.mean(evaluator.y_trend == evaluator.y_pred_trend),
+        **{f"bankroll_{name}": r["bankroll"][-1] for name, r in results.items()},
+    }
+
+
+def _preprocess(ticker, normalizer_dir=None):
+    from alstm_stock_market.src.data.market_data import MarketData
+    from alstm_stock_market.src.data.normalizer import Normalizer
+    from alstm_stock_market.src.data.preprocessor import Preprocessor
+    from alstm_stock_market.src.helpers.utils import get_latest_normalizer
+
+    data = MarketData().download(ticker, p.start, p.end)
+    normalizer_path = normalizer_dir and get_latest_normalizer(normalizer_dir)
+
+    pre = Preprocessor(
+        data,
+        p.sets_sizes,
+        normalizer=Normalizer.load(normalizer_path) if normalizer_path else None,
+    )
+    pre.run()
+    return pre
+
+
+def run_ticker(ticker, weights_dir, logs_dir, load_weights=False):
+    from alstm_stock_market.src.helpers.utils import save_normalizer
+    from alstm_stock_market.src.model.dataset import split_datasets
+    from alstm_stock_market.src.model.model import Model
+
+    # Weights, checkpoints, normalizers and results of each ticker in their own
+    # directories, while the market data and wavelet caches stay shared
+    os.environ["WEIGHTS"] = ticker_dir(weights_dir, ticker)
+
+    pre = _preprocess(ticker, os.environ["WEIGHTS"] if load_weights else None)
+
+    model = Model(load_weights=load_weights)
+    if p.streaming_input:
+        datasets = split_datasets(pre)
+        model.fit(datasets["train"], None, datasets["valdn"], None, verbose=0)
+    else:
+        model.fit(pre.X_train, pre.y_train, pre.X_valdn, pre.y_valdn, verbose=0)
+    if not load_weights:
+        save_normalizer(pre.normalizer)
+
+    return _evaluate(ticker, pre, model.predict(pre.X_test), logs_dir)
+
+
+def run_global(tickers, load_weights=False):
+    """One model shared by every ticker, trained on their interleaved windows."""
+    paths = {name: os.environ[name] for name in ["WEIGHTS", "LOGS"]}
+    try:
+        return _run_global(tickers, load_weights)
+    finally:
+        os.environ.update(paths)
+
+
+def _run_global(tickers, load_weights):
+    from alstm_stock_market.src.data.cross_section import CrossSection
+    from alstm_stock_market.src.helpers.utils import save_normalizer
+    from alstm_stock_market.src.model.model import Model
+
+    weights_dir = ticker_dir(os.environ["WEIGHTS"], "_global")
+    logs_dir = ticker_dir(os.environ["LOGS"], "_global")
+    tickers_path = os.path.join(weights_dir, "tickers.json")
+    os.environ["WEIGHTS"] = weights_dir
+
+    # Embedding rows follow the ticker order the weights were trained with
+    universe = None
+    if load_weights:
+        with open(tickers_path) as file:
+            universe = json.load(file)
+
+    preprocessors, report = {}, {}
+    for ticker in tickers:
+        start = perf_counter()
+        try:
+            if universe is not None and ticker not in universe:
+                raise ValueError(f"{ticker} was not part of the trained model")
+            preprocessors[ticker] = _preprocess(
+                ticker, ticker_dir(weights_dir, ticker) if load_weights else None
+            )
+        except Exception as error:
+            report[ticker] = {
+                "status": "error",
+                "error": "".join(traceback.format_exception_only(error)).strip(),
+                "seconds": perf_counter() - start,
+            }
+
+    if not preprocessors:
+        return report
+    universe = universe or list(preprocessors)
+    cross_section = CrossSection(
+        preprocessors, {ticker: universe.index(ticker) for ticker in preprocessors}
+    )
+    embedding = p.ticker_embedding_size > 0
+
+    start = perf_counter()
+    model = Model(
+        load_weights=load_weights,
+        n_tickers=len(universe) if embedding else None,
+        batch_size=p.global_batch_size,
+    )
+    if p.streaming_input:
+        model.fit(
+            cross_section.dataset("train", embedding),
+            None,
+            cross_section.dataset("valdn", embedding),
+            None,
+            verbose=0,
+        )
+    else:
+        model.fit(
+            cross_section.inputs("train", embedding),
+            cross_section.y("train"),
+            cross_section.inputs("valdn", embedding),
+            cross_section.y("valdn"),
+            verbose=0,
+        )
+    if not load_weights:
+        for ticker, pre in preprocessors.items():
+            save_normalizer(pre.normalizer, ticker_dir(weights_dir, ticker))
+        with open(tickers_path, "w") as file:
+            json.dump(universe, file)
+
+    # Every ticker's test windows in a single batched predict
+    y_pred = cross_section.split(
+        "test", model.predict(cross_section.inputs("test", embedding))
+    )
+    seconds = (perf_counter() - start) / max(1, len(preprocessors))
+
+    for ticker, pre in preprocessors.items():
+        try:
+            report[ticker] = {
+                "status": "ok",
+                **_evaluate(ticker, pre, y_pred[ticker], logs_dir),
+            }
+        except Exception as error:
+            report[ticker] = {
+                "status": "error",
+                "error": "".join(traceback.format_exception_only(error)).strip(),
+            }
+        report[ticker]["seconds"] = seconds
+
+    return {ticker: report[ticker] for ticker in tickers}
+
+
+def run_batch(tickers, n_workers=None, load_weights=False):
+    """Full pipeline for every ticker, at most n_workers at a time."""
+    n_workers = n_workers or p.batch_workers or os.cpu_count()
+    threads = max(1, os.cpu_count() // n_workers)
+    dirs = (os.environ["WEIGHTS"], os.environ["LOGS"])
+
+    def new_pool():
+        # A fresh process per ticker, so TensorFlow memory never piles up
+        return ProcessPoolExecutor(
+            n_workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+            max_tasks_per_child=1,
+        )
+
+    pending = list(reversed(tickers))
+    running, report, crashes = {}, {}, dict.fromkeys(tickers, 0)
+    pool = new_pool()
+    while pending or running:
+        # Bounded, only n_workers tickers are in flight at any time
+        while pending and len(running) < n_workers:
+            ticker = pending.pop()
+            future = pool.submit(run_ticker, ticker, *dirs, load_weights)
+            running[future] = (ticker, perf_counter())
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        broken = False
+        for future in done:
+            ticker, start = running.pop(future)
+            try:
+                report[ticker] = {"status": "ok", **future.result()}
+            except BrokenProcessPool:
+                # A killed worker takes down the pool and every ticker running
+                # in it, those are retried before being reported as failed
+                broken = True
+                crashes[ticker] += 1
+                if crashes[ticker] <= p.batch_retries:
+                    pending.append(ticker)
+                    continue
+                report[ticker] = {"status": "error", "error": "Worker process died"}
+            except Exception as error:
+                report[ticker] = {
+                    "status": "error",
+                    "error": "".join(traceback.format_exception_only(error)).strip(),
+                }
+            report[ticker]["seconds"] = perf_counter() - start
+
+        if broken:
+            pending.extend(ticker for ticker, _ in running.values())
+            running = {}
+            pool.shutdown(cancel_futures=True)
+            pool = new_pool()
+    pool.shutdown()
+
+    return {ticker: report[ticker] for ticker in tickers}
+
+
+def save_report(report):
+    tickers = list(report)
+    metrics = sorted({k for r in report.values() for k in r} - {"status", "error"})
+    return save_columns(
+        {
+            "tickers": tickers,
+            "status": [report[t]["status"] for t in tickers],
+            "error": [report[t].get("error", "") for t in tickers],
+            **{
+                metric: np.array([report[t].get(metric, np.nan) for t in tickers])
+                for metric in metrics
+            },
+        },
+        "batch",
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("tickers", nargs="*", help="Tickers to run, as in Yahoo!")
+    parser.add_argument(
+        "-f", "--file", help="Text file with one ticker per line, added to the list."
+    )
+    parser.add_argument(
+        "-n", "--workers", type=int, default=None, help="Tickers run at the same time."
+    )
+    parser.add_argument(
+        "-w",
+        "--load-weights",
+        action="store_true",
+        help="Load each ticker's most recent weights instead of training.",
+    )
+    parser.add_argument(
+        "-g",
+        "--global-model",
+        action="store_true",
+        help="Train a single model on the windows of every ticker.",
+    )
+    args = parser.parse_args()
+
+    tickers = list(args.tickers)
+    if args.file:
+        with open(args.file) as file:
+            tickers += [line.strip() for line in file if line.strip()]
+    if not tickers:
+        parser.error("no tickers given")
+    tickers = list(dict.fromkeys(tickers))
+
+    if args.global_model:
+        report = run_global(tickers, args.load_weights)
+    else:
+        report = run_batch(tickers, args.workers, args.load_weights)
+    path = save_report(report)
+
+    failed = [t for t, r in report.items() if r["status"] != "ok"]
+    print(
+        f"\nResumo do lote: {len(tickers) - len(failed)} de {len(tickers)} tickers concluídos."
+    )
+    for ticker, result in report.items():
+        if result["status"] == "ok":
+            print(
+                f"{ticker}: RMSE {result['rmse']:.4f}, R² {result['r2']:.4f},",
+                f"acerto de tendência {result['hit_rate']:.2%}",
+                f"({result['seconds']:.0f} s)",
+            )
+        else:
+            print(f"{ticker}: falhou, {result['error']}")
+    print(f"Resultados salvos em {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1159 @@
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from resource import RUSAGE_SELF, getrusage
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+import numpy as np
+import pandas as pd
+import pywt
+from numpy.lib.stride_tricks import sliding_window_view
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.data.market_data import (
+    LocalFetcher,
+    MarketData,
+    yahoo_fetcher,
+)
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.data.preprocessor import Preprocessor
+from alstm_stock_market.src.data.wavelet import wavelet_denoise
+from alstm_stock_market.src.manager import strategies as st
+from alstm_stock_market.src.manager.backtest import backtest as run_backtest
+from alstm_stock_market.src.manager.simulation import simulate
+
+
+def synthetic_data(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    spread = np.abs(rng.normal(0, 0.005, rows)) * close
+    return pd.DataFrame(
+        {
+            "Open": close + rng.normal(0, 0.002, rows) * close,
+            "High": close + spread,
+            "Low": close - spread,
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1e6, 1e9, rows),
+        },
+        index=pd.date_range("1900-01-01", periods=rows, freq="h"),
+    )
+
+
+def timed(func, *args, **kwargs):
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def report(title, header, rows):
+    print(f"\n{title}")
+    print(" | ".join(f"{h:>12}" for h in header))
+    for row in rows:
+        print(
+            " | ".join(
+                f"{v:>12.4f}" if isinstance(v, float) else f"{v:>12}" for v in row
+            )
+        )
+
+
+def _legacy_sequentialize(data_normalized, target_col_idx):
+    X_seq = []
+    y_seq = []
+    for i in range(len(data_normalized) - p.time_step):
+        X = data_normalized.iloc[i : i + p.time_step, :]
+        y = data_normalized.iloc[i + p.time_step, target_col_idx]
+        X_seq.append(X)
+        y_seq.append(y)
+    return np.array(X_seq), np.array(y_seq)
+
+
+def windowing(rows_list):
+    results = []
+    for rows in rows_list:
+        data = synthetic_data(rows)
+        pre = Preprocessor(data, p.sets_sizes, cache=False)
+        pre.data_normalized = (pre.data - pre.data.mean()) / pre.data.std()
+
+        (X_loop, y_loop), loop_time = timed(
+            _legacy_sequentialize, pre.data_normalized, pre.target_col_idx
+        )
+        _, view_time = timed(pre._sequentialize)
+
+        results.append(
+            (rows, loop_time, view_time, loop_time / view_time, X_loop.nbytes >> 20)
+        )
+        del X_loop, y_loop
+
+    report(
+        "Janelamento: loop com iloc vs. visão strided",
+        ["linhas", "loop (s)", "strided (s)", "speedup", "loop (MiB)"],
+        results,
+    )
+
+
+def _legacy_denoise(data):
+    def calc_universal_threshold(finnest_coeffs):
+        sigma = np.std(finnest_coeffs)
+        n = len(finnest_coeffs)
+        return sigma * np.sqrt(2 * np.log(n))
+
+    data_transformed = pd.DataFrame(index=data.index, columns=data.columns)
+
+    for col in data.columns:
+        coeffs = pywt.wavedec(data[col], p.wavelet, p.wavelet_mode, level=p.levels)
+        for i, shrink in enumerate(p.shrink_coeffs):
+            if shrink:
+                threlshold = calc_universal_threshold(coeffs[-1])
+                coeffs[i] = pywt.threshold(coeffs[i], threlshold, p.threshold_mode)
+
+        data_transformed[col] = pywt.waverec(coeffs, p.wavelet, p.wavelet_mode)[
+            : len(data.index)
+        ]
+    return data_transformed
+
+
+def denoise(rows, tickers_list):
+    results = []
+    for tickers in tickers_list:
+        data = pd.concat(
+            [
+                synthetic_data(rows, seed).add_suffix(f"_{seed}")
+                for seed in range(tickers)
+            ],
+            axis=1,
+        )
+
+        _, loop_time = timed(_legacy_denoise, data)
+        _, batched_time = timed(wavelet_denoise, data.to_numpy(dtype=np.float64))
+
+        results.append(
+            (tickers, data.shape[1], loop_time, batched_time, loop_time / batched_time)
+        )
+
+    report(
+        f"Transformada wavelet: loop por coluna vs. em lote ({rows} linhas)",
+        ["tickers", "colunas", "loop (s)", "lote (s)", "speedup"],
+        results,
+    )
+
+
+def causal(rows_list):
+    from alstm_stock_market.src.data.wavelet import causal_wavelet_denoise
+
+    results = []
+    for rows in rows_list:
+        values = synthetic_data(rows).to_numpy(dtype=np.float64)
+        _, run_time = timed(causal_wavelet_denoise, values)
+        results.append((rows, run_time, rows / run_time))
+
+    report(
+        f"Transformada wavelet causal (janela de {p.causal_window} linhas)",
+        ["linhas", "tempo (s)", "linhas/s"],
+        results,
+    )
+
+
+def _input_pipeline_worker(rows, epochs, streaming):
+    from alstm_stock_market.src.model.dataset import split_datasets
+    from alstm_stock_market.src.model.model import _fit_inputs, create_model
+
+    model = create_model()
+    baseline = getrusage(RUSAGE_SELF).ru_maxrss
+
+    pre = Preprocessor(synthetic_data(rows), p.sets_sizes, cache=False)
+    pre.run()
+    if streaming:
+        inputs = _fit_inputs(split_datasets(pre)["train"], None)
+    else:
+        inputs = _fit_inputs(pre.X_train, pre.y_train)
+
+    _, fit_time = timed(model.fit, **inputs, epochs=epochs, shuffle=False, verbose=0)
+    return (getrusage(RUSAGE_SELF).ru_maxrss - baseline) >> 10, epochs / fit_time
+
+
+def input_pipeline(rows, epochs):
+    results = []
+    for name, streaming in [("arrays", False), ("tf.data", True)]:
+        # Fresh process per path, so peak memory isn't shared between them
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+            memory, speed = executor.submit(
+                _input_pipeline_worker, rows, epochs, streaming
+            ).result()
+        results.append((name, memory, speed))
+
+    report(
+        f"Entrada do treino ({rows} linhas, {epochs} epochs, CPU)",
+        ["caminho", "pico (MiB)", "epochs/s"],
+        results,
+    )
+
+
+def attention(steps):
+    from alstm_stock_market.src.model.model import create_model
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(p.batch_size, p.time_step, p.num_features)).astype(np.float32)
+    y = rng.normal(size=p.batch_size).astype(np.float32)
+
+    results = []
+    for name, fused, jit in [
+        ("original", False, False),
+        ("fundida", True, False),
+        ("fundida+XLA", True, True),
+    ]:
+        model = create_model(fused_attention=fused, jit_compile=jit)
+        model.train_on_batch(X, y)  # Tracing and compilation
+        model.predict_on_batch(X[:1])
+
+        _, train_time = timed(
+            lambda: [model.train_on_batch(X, y) for _ in range(steps)]
+        )
+        _, infer_time = timed(
+            lambda: [model.predict_on_batch(X[:1]) for _ in range(steps)]
+        )
+        results.append((name, 1e3 * train_time / steps, 1e3 * infer_time / steps))
+
+    report(
+        f"Modelo completo na CPU (lote de {p.batch_size}, média de {steps} passos)",
+        ["variante", "treino (ms)", "inferência (ms)"],
+        results,
+    )
+
+
+def tuning(trials, epochs, workers_list):
+    from alstm_stock_market.src.model.tuning import TuningExecutor
+
+    pre = Preprocessor(synthetic_data(5_000), p.sets_sizes, cache=False)
+    pre.run()
+    candidates = [
+        {"epochs": epochs, "model__learning_rate": lr}
+        for lr in np.geomspace(1e-4, 1e-2, trials)
+    ]
+
+    results = []
+    with TemporaryDirectory() as cache_dir:
+        os.environ.setdefault("CACHE", cache_dir)
+        for workers in workers_list:
+            with TuningExecutor(
+                pre.X_train, pre.y_train, n_workers=workers
+            ) as executor:
+                executor.evaluate(candidates)
+                results.append((workers, executor.trials_per_hour))
+
+    report(
+        f"Tunagem: {trials} candidatos x 3 dobras, {epochs} epochs, {os.cpu_count()} CPUs",
+        ["workers", "trials/hora"],
+        results,
+    )
+
+
+def market_data(online, latency):
+    if online:
+        fetcher = yahoo_fetcher
+    else:
+        data = synthetic_data(15_000)
+        data.index = pd.bdate_range(p.start, periods=len(data))
+        local = LocalFetcher({p.ticker: data})
+
+        def fetcher(ticker, start, end):
+            sleep(latency)  # Network round-trip stand-in
+            return local(ticker, start, end)
+
+    start, end = p.start, p.end
+    extended_end = (pd.Timestamp(end) + pd.Timedelta(days=30)).strftime("%Y-%m-%d")
+
+    with TemporaryDirectory() as cache_dir:
+        cache = MarketData(fetcher, cache_dir)
+        cold, cold_time = timed(cache.download, p.ticker, start, end)
+        _, warm_time = timed(cache.download, p.ticker, start, end)
+        _, incremental_time = timed(cache.download, p.ticker, start, extended_end)
+
+    report(
+        f"Dados de mercado ({'yahoo' if online else 'local'}): {len(cold)} dias",
+        ["frio (s)", "quente (s)", "+30 dias (s)"],
+        [(cold_time, warm_time, incremental_time)],
+    )
+
+
+def global_model(tickers, rows, epochs):
+    from alstm_stock_market.src.data.cross_section import CrossSection
+    from alstm_stock_market.src.model.model import create_model
+
+    preprocessors = {}
+    for i in range(tickers):
+        pre = Preprocessor(synthetic_data(rows, seed=i), p.sets_sizes, cache=False)
+        pre.run()
+        preprocessors[f"T{i}"] = pre
+    cross_section = CrossSection(preprocessors)
+    windows = len(cross_section.y("train"))
+
+    def separate():
+        errors = []
+        for pre in preprocessors.values():
+            model = create_model()
+            model.fit(
+                pre.X_train,
+                pre.y_train,
+                batch_size=p.batch_size,
+                epochs=epochs,
+                shuffle=False,
+                verbose=0,
+            )
+            y_pred = model.predict(pre.X_test, batch_size=p.batch_size, verbose=0)
+            errors.append((y_pred.flatten() - pre.y_test) ** 2)
+        return np.concatenate(errors).mean()
+
+    def shared(embedding):
+        model = create_model(n_tickers=tickers if embedding else None)
+        model.fit(
+            cross_section.inputs("train", embedding),
+            cross_section.y("train"),
+            batch_size=p.global_batch_size,
+            epochs=epochs,
+            shuffle=False,
+            verbose=0,
+        )
+        y_pred = model.predict(
+            cross_section.inputs("test", embedding),
+            batch_size=p.global_batch_size,
+            verbose=0,
+        )
+        return ((y_pred.flatten() - cross_section.y("test")) ** 2).mean()
+
+    results = []
+    for name, run in [
+        ("um por ticker", separate),
+        ("global", lambda: shared(False)),
+        ("global+embedding", lambda: shared(True)),
+    ]:
+        mse, seconds = timed(run)
+        results.append((name, seconds, epochs * windows / seconds, float(mse)))
+
+    report(
+        f"Modelo global: {tickers} tickers x {rows} linhas, {epochs} epochs",
+        ["modo", "tempo (s)", "janelas/s", "MSE teste"],
+        results,
+    )
+
+
+def _legacy_backtest(strategy, trend_predictions, market_returns, initial_cash):
+    bankroll, bets, gains_losses = [initial_cash], [strategy.initial_bet], []
+    for pred, pct_change in zip(trend_predictions, market_returns):
+        pct_gain_loss = pct_change if pred else -pct_change
+        gains_losses.append(bets[-1] * pct_gain_loss)
+        bankroll.append(max(bankroll[-1] + gains_losses[-1], 0))
+        if bankroll[-1] == 0:
+            break
+        bets.append(strategy.next_bet(gains_losses[-1] >= 0, bankroll[-1]))
+    return bankroll
+
+
+def _strategies(initial_cash, initial_bet):
+    return [
+        st.Martingale(initial_bet),
+        st.Paroli(initial_bet),
+        st.DAlembert(initial_bet),
+        st.Fixed(initial_bet),
+        *st.proportional_grid(initial_cash).values(),
+    ]
+
+
+def backtest(rounds_list):
+    results = []
+    for rounds in rounds_list:
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0, 0.01, rounds)
+        preds = rng.random(rounds) < 0.55
+
+        _, loop_time = timed(
+            lambda: [
+                _legacy_backtest(strategy, preds, returns, 1000)
+                for strategy in _strategies(1000, 100)
+            ]
+        )
+        _, vectorized_time = timed(
+            run_backtest, _strategies(1000, 100), preds, returns, 1000
+        )
+        results.append(
+            (rounds, loop_time, vectorized_time, loop_time / vectorized_time)
+        )
+
+    report(
+        f"Backtest: {len(_strategies(1000, 100))} estratégias",
+        ["rodadas", "loop (s)", "vetorizado (s)", "speedup"],
+        results,
+    )
+
+
+def _simulation_worker(paths, workers):
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.01, 250)
+    preds = rng.random(250) < 0.55
+
+    _, seconds = timed(
+        simulate, _strategies(1000, 100), preds, returns, 1000, paths, n_workers=workers
+    )
+    return seconds, getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def simulation(paths_list, workers_list):
+    results = []
+    for paths in paths_list:
+        for workers in workers_list:
+            # A fresh process per run, so the peak memory is its own
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                seconds, peak_memory = pool.submit(
+                    _simulation_worker, paths, workers
+                ).result()
+            results.append((paths, workers, seconds, paths / seconds, peak_memory))
+
+    report(
+        f"Simulação: {len(_strategies(1000, 100))} estratégias, 250 rodadas",
+        ["trajetórias", "workers", "tempo (s)", "trajet./s", "pico (MB)"],
+        results,
+    )
+
+
+def server(requests, concurrency_list):
+    import json
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.request import urlopen
+
+    from bizdays import Calendar
+
+    from alstm_stock_market.src.app.server import PredictionServer, Predictor, handler
+    from alstm_stock_market.src.helpers.utils import save_weights
+    from alstm_stock_market.src.model.model import create_model
+
+    os.environ.setdefault(
+        "CALENDAR",
+        os.path.join(os.path.dirname(__file__), "src/helpers/calendars/us.cal"),
+    )
+    calendar = Calendar.load(filename=os.environ["CALENDAR"])
+
+    data = synthetic_data(2_000)
+    data.index = pd.bdate_range("2015-01-01", periods=len(data))
+    dates = [
+        d.strftime("%Y-%m-%d")
+        for d in calendar.seq("2018-01-02", data.index[-1])[-requests:]
+    ]
+
+    with TemporaryDirectory() as tmp:
+        for name in ["WEIGHTS", "LOGS", "CACHE"]:
+            os.environ[name] = os.path.join(tmp, name.lower())
+            os.makedirs(os.environ[name])
+        save_weights(create_model())
+        market = MarketData(LocalFetcher({p.ticker: data}), os.environ["CACHE"])
+
+        # What every forecast paid before, a fresh model, calendar and download
+        predictor, cold_time = timed(Predictor, market)
+        _, first_time = timed(predictor.predict, dates[-1])
+
+        httpd = PredictionServer(("127.0.0.1", 0), handler(predictor))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/predict?date="
+
+        def request(date):
+            start = perf_counter()
+            with urlopen(url + date) as response:
+                json.load(response)
+            return perf_counter() - start
+
+        results = [("frio", 1, (cold_time + first_time) * 1e3, "-", 1)]
+        for concurrency in concurrency_list:
+            predictor.predict(dates[0])  # Prices of every date already in memory
+            predictor.predictions = {}
+            calls = predictor.batcher.calls
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = np.array(list(pool.map(request, dates))) * 1e3
+            results.append(
+                (
+                    "servidor",
+                    concurrency,
+                    float(np.percentile(latencies, 50)),
+                    float(np.percentile(latencies, 95)),
+                    predictor.batcher.calls - calls,
+                )
+            )
+        httpd.shutdown()
+
+    report(
+        f"Servidor: {len(dates)} previsões por rodada",
+        ["modo", "concorrência", "p50 (ms)", "p95 (ms)", "chamadas"],
+        results,
+    )
+
+
+def _import_times(module):
+    """Own import time of every module from python -X importtime, by package."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "TF_CPP_MIN_LOG_LEVEL": "3"},
+        check=True,
+    )
+
+    packages = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line.removeprefix("import time:").split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1e6
+    return packages
+
+
+def startup(modules, top):
+    for module in modules:
+        packages = _import_times(module)
+        total = sum(packages.values())
+        rows = sorted(packages.items(), key=lambda item: -item[1])[:top]
+        report(
+            f"Importação de {module}: {total:.2f} s",
+            ["pacote", "tempo (s)"],
+            rows,
+        )
+
+
+def export(calls, quantizations):
+    from alstm_stock_market.src.helpers.utils import get_latest_weights, save_weights
+    from alstm_stock_market.src.model.export import (
+        ExportedModel,
+        export_model,
+        export_path,
+    )
+    from alstm_stock_market.src.model.model import Model, create_model
+
+    rng = np.random.default_rng(0)
+    windows = rng.normal(size=(calls, p.time_step, p.num_features)).astype("float32")
+
+    def latency(predict):
+        predict(windows[:1])  # Tracing and allocation are not part of a call
+        times = [timed(predict, window[np.newaxis])[1] for window in windows]
+        return np.percentile(times, 50) * 1e3, np.percentile(times, 95) * 1e3
+
+    with TemporaryDirectory() as tmp:
+        os.environ["WEIGHTS"] = tmp
+        save_weights(create_model())
+        weights = get_latest_weights()
+
+        model, load_time = timed(Model, load_weights=True)
+        reference = model.model.predict_on_batch(windows).flatten()
+        results = [
+            ("keras predict", load_time, *latency(model.predict), 0.0),
+            (
+                "keras on_batch",
+                load_time,
+                *latency(model.model.predict_on_batch),
+                0.0,
+            ),
+        ]
+
+        for serving_format, quantization in [("saved_model", None)] + [
+            ("tflite", None if q == "float32" else q) for q in quantizations
+        ]:
+            path = export_model(
+                model.model,
+                export_path(weights, serving_format, quantization),
+                serving_format,
+                quantization,
+            )
+            exported, load_time = timed(ExportedModel, path)
+            error = np.abs(exported.predict(windows) - reference).max()
+            results.append(
+                (
+                    os.path.basename(path).split("_", 2)[-1],
+                    load_time,
+                    *latency(exported.predict_on_batch),
+                    float(error),
+                )
+            )
+
+    report(
+        f"Exportação: {calls} previsões de uma janela",
+        ["formato", "carga (s)", "p50 (ms)", "p95 (ms)", "erro máx."],
+        results,
+    )
+
+
+class _LatentStorage:
+    """Storage with a fixed delay per request, counting round-trips."""
+
+    def __init__(self, storage, latency):
+        self.storage, self.latency, self.requests = storage, latency, 0
+
+    def fetch(self, start, end):
+        self.requests += 1
+        sleep(self.latency)
+        return self.storage.fetch(start, end)
+
+    def bulk_write(self, docs):
+        self.requests += 1
+        sleep(self.latency)
+        return self.storage.bulk_write(docs)
+
+    def close(self):
+        pass
+
+
+def _legacy_sync(storage, start, pred_date, pred_close, close_prices):
+    # Linear scans of the fetched list and one request per changed document
+    interval_docs = list(storage.fetch(start, pred_date).values())
+    for doc in interval_docs:
+        if doc["date"] == pred_date:
+            if not np.isclose(doc["pred_close"], pred_close):
+                doc["pred_close"] = pred_close
+                storage.bulk_write([doc])
+            break
+    else:
+        storage.bulk_write([{"date": pred_date, "pred_close": pred_close}])
+
+    for date, price in close_prices.items():
+        for doc in interval_docs:
+            if doc["date"] == date.strftime("%Y-%m-%d"):
+                interval_docs.remove(doc)
+                if ("close" not in doc) or (not np.isclose(doc["close"], price)):
+                    doc["close"] = price
+                    storage.bulk_write([doc])
+                break
+
+
+def storage(docs_list, latency):
+    from alstm_stock_market.src.app.app import App
+    from alstm_stock_market.src.app.storage import SQLiteStorage
+
+    os.environ.setdefault(
+        "CALENDAR",
+        os.path.join(os.path.dirname(__file__), "src/helpers/calendars/us.cal"),
+    )
+
+    results = []
+    with TemporaryDirectory() as tmp:
+        for name in ["WEIGHTS", "LOGS", "CACHE"]:
+            os.environ[name] = os.path.join(tmp, name.lower())
+            os.makedirs(os.environ[name], exist_ok=True)
+
+        for n_docs in docs_list:
+            dates = pd.bdate_range(end="2023-12-29", periods=n_docs + 1)
+            pred_date = dates[-1].strftime("%Y-%m-%d")
+            os.environ["MAX_TRAINING_DATE"] = pred_date
+
+            # Every stored close is stale, the worst case for both paths
+            close_prices = pd.Series(np.arange(n_docs, dtype=float), index=dates[:-1])
+            seed = [
+                {"date": d.strftime("%Y-%m-%d"), "pred_close": 1.0, "close": -1.0}
+                for d in dates[:-1]
+            ]
+
+            timings = []
+            for sync in ["legacy", "bulk"]:
+                database = SQLiteStorage(":memory:")
+                database.bulk_write(seed)
+                latent = _LatentStorage(database, latency)
+
+                app = App(pred_date, storage=latent)
+                app.interval_start = dates[0].strftime("%Y-%m-%d")
+                app.pred_close, app.close_prices = 2.0, close_prices
+                if sync == "legacy":
+                    _, seconds = timed(
+                        _legacy_sync,
+                        latent,
+                        app.interval_start,
+                        pred_date,
+                        app.pred_close,
+                        close_prices,
+                    )
+                else:
+                    _, seconds = timed(app._sync)
+                timings.append((seconds, latent.requests))
+                database.close()
+
+            (legacy_time, legacy_requests), (bulk_time, bulk_requests) = timings
+            results.append(
+                (
+                    n_docs,
+                    legacy_requests,
+                    bulk_requests,
+                    legacy_time,
+                    bulk_time,
+                    legacy_time / bulk_time,
+                )
+            )
+
+    report(
+        f"Persistência: {latency * 1e3:.0f} ms por requisição",
+        ["documentos", "req. antes", "req. bulk", "antes (s)", "bulk (s)", "speedup"],
+        results,
+    )
+
+
+def backfill(days, latency):
+    from alstm_stock_market.src.app.app import App, Backfill
+    from alstm_stock_market.src.app.storage import SQLiteStorage
+    from alstm_stock_market.src.helpers.utils import save_weights
+    from alstm_stock_market.src.model.model import create_model
+
+    os.environ.setdefault(
+        "CALENDAR",
+        os.path.join(os.path.dirname(__file__), "src/helpers/calendars/us.cal"),
+    )
+
+    data = synthetic_data(3_000)
+    data.index = pd.bdate_range("2012-01-02", periods=len(data))
+    local = LocalFetcher({p.ticker: data})
+
+    def fetcher(ticker, start, end):
+        sleep(latency)  # Network round-trip stand-in
+        return local(ticker, start, end)
+
+    with TemporaryDirectory() as tmp:
+        for name in ["WEIGHTS", "LOGS", "CACHE"]:
+            os.environ[name] = os.path.join(tmp, name.lower())
+            os.makedirs(os.environ[name])
+        save_weights(create_model())
+        os.environ["MAX_TRAINING_DATE"] = data.index[-1].strftime("%Y-%m-%d")
+
+        backfill = Backfill(
+            "2022-01-03",
+            data.index[-1].strftime("%Y-%m-%d"),
+            storage=SQLiteStorage(os.path.join(tmp, "backfill.sqlite")),
+            market_data=MarketData(fetcher, os.path.join(tmp, "batch")),
+        )
+        backfill.pred_dates = backfill.pred_dates[:days]
+        backfill.end = backfill.pred_dates[-1].strftime("%Y-%m-%d")
+        _, batch_time = timed(backfill.run)
+
+        def one_by_one():
+            storage = SQLiteStorage(":memory:")
+            market_data = MarketData(fetcher, os.path.join(tmp, "loop"))
+            for date in backfill.pred_dates:
+                app = App(date.strftime("%Y-%m-%d"), storage, market_data)
+                app._make_prediction()
+                app._sync()
+
+        _, loop_time = timed(one_by_one)
+
+    report(
+        f"Backfill: {len(backfill.pred_dates)} dias úteis, {latency * 1e3:.0f} ms por download",
+        ["um a um (s)", "backfill (s)", "speedup"],
+        [(loop_time, batch_time, loop_time / batch_time)],
+    )
+
+
+def walk_forward(rows, days, epochs):
+    from alstm_stock_market.src.model.model import create_model
+    from alstm_stock_market.src.model.walk_forward import WalkForward, default_policies
+
+    data = synthetic_data(rows)
+    data.index = pd.bdate_range("2000-01-03", periods=rows)
+    start = data.index[-days]
+
+    # Initial weights from every window before the first predicted day
+    pre = Preprocessor(data[data.index < start], p.sets_sizes, cache=False)
+    pre.run()
+    model = create_model()
+    model.fit(
+        pre.X, pre.y, batch_size=p.batch_size, epochs=epochs, shuffle=False, verbose=0
+    )
+
+    with TemporaryDirectory() as tmp:
+        os.environ["LOGS"] = tmp
+        engine = WalkForward(data, start, model, pre.normalizer)
+        results = engine.run_all(default_policies())
+
+    report(
+        f"Walk-forward: {days} dias previstos, {p.incremental_epochs} epochs por retreino",
+        [
+            "política",
+            "RMSE",
+            "acerto",
+            "retreinos",
+            "janelas",
+            "treino (s)",
+            "previsão (s)",
+        ],
+        [
+            (
+                name,
+                float(r["rmse"]),
+                float(r["hit_rate"]),
+                r["retrains"],
+                r["train_windows"],
+                r["fit_time"],
+                r["predict_time"],
+            )
+            for name, r in results.items()
+        ],
+    )
+
+
+def _legacy_latest_weights():
+    weights = [w for w in os.listdir(os.environ["WEIGHTS"]) if w.endswith(".h5")]
+    weights.sort()
+    return os.path.join(os.environ["WEIGHTS"], weights[-1])
+
+
+def registry(versions_list, loads):
+    import shutil
+
+    from alstm_stock_market.src.helpers.utils import get_latest_weights, save_weights
+    from alstm_stock_market.src.model.model import Model, create_model
+    from alstm_stock_market.src.model.registry import model_cache
+
+    results = []
+    for versions in versions_list:
+        with TemporaryDirectory() as tmp:
+            os.environ["WEIGHTS"] = tmp
+            save_weights(create_model())
+            # Older sessions, each a weights file with its normalizer
+            source = get_latest_weights()
+            for i in range(versions - 1):
+                stem = os.path.join(tmp, f"2000-01-01_00.00.{i:06d}")
+                shutil.copy(source, f"{stem}_weights.h5")
+                open(f"{stem}_normalizer.json", "w").close()
+            os.remove(os.path.join(tmp, "index.json"))
+
+            def legacy_load():
+                model = create_model()
+                model.load_weights(_legacy_latest_weights())
+                return model
+
+            _, lookup_legacy = timed(
+                lambda: [_legacy_latest_weights() for _ in range(loads)]
+            )
+            _, migrate_time = timed(get_latest_weights)
+            _, lookup = timed(lambda: [get_latest_weights() for _ in range(loads)])
+
+            _, legacy_time = timed(lambda: [legacy_load() for _ in range(loads)])
+            model_cache.models.clear()
+            _, cached_time = timed(
+                lambda: [Model(load_weights=True) for _ in range(loads)]
+            )
+
+        results.append(
+            (
+                versions,
+                lookup_legacy / loads * 1e3,
+                lookup / loads * 1e3,
+                migrate_time * 1e3,
+                legacy_time / loads * 1e3,
+                cached_time / loads * 1e3,
+            )
+        )
+
+    report(
+        f"Carregamento de pesos: {loads} carregamentos por processo (ms por carregamento)",
+        [
+            "versões",
+            "busca antes",
+            "busca índice",
+            "migração",
+            "carga antes",
+            "carga cache",
+        ],
+        results,
+    )
+
+
+def _legacy_preprocess(data):
+    # Float64 frames until the windows, as before the dtype policy
+    pre = Preprocessor(data, p.sets_sizes, cache=False)
+    transformed = wavelet_denoise(pre.data.to_numpy(dtype=np.float64))
+    pre.data_transformed = pd.DataFrame(
+        transformed, index=pre.data.index, columns=pre.data.columns
+    )
+    pre.normalizer = Normalizer(pre.target_col_idx).update(transformed)
+    pre.data_normalized = (
+        pre.data_transformed - pre.normalizer.mean
+    ) / pre.normalizer.std
+    pre.values = pre.data_normalized.to_numpy(dtype=np.float32)
+    windows = sliding_window_view(pre.values, p.time_step, axis=0)
+    pre.X = windows.transpose(0, 2, 1)[:-1]
+    pre.y = pre.values[p.time_step :, pre.target_col_idx]
+    pre._split()
+    return pre
+
+
+def _preprocess(data, dtype):
+    p.dtype = dtype
+    pre = Preprocessor(data, p.sets_sizes, cache=False)
+    pre.run()
+    return pre
+
+
+def precision(rows, epochs):
+    import tracemalloc
+
+    from alstm_stock_market.src.model.evaluator import Evaluator
+    from alstm_stock_market.src.model.model import create_model
+
+    data = synthetic_data(rows)
+    dtype = p.dtype
+
+    results = []
+    for name, preprocess in [
+        ("antes", _legacy_preprocess),
+        ("float64", lambda data: _preprocess(data, "float64")),
+        ("float32", lambda data: _preprocess(data, "float32")),
+    ]:
+        tracemalloc.start()
+        pre, run_time = timed(preprocess, data)
+        # Arrays the preprocessor keeps, and the peak while denoising
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, pre, run_time, kept / 2**20, peak / 2**20))
+    p.dtype = dtype
+
+    reference = results[1][1]
+    report(
+        f"Pré-processamento de {rows} linhas (sem materializar as janelas)",
+        ["caminho", "tempo (s)", "retido (MiB)", "pico (MiB)", "X", "erro máx. X"],
+        [
+            (
+                name,
+                run_time,
+                kept,
+                peak,
+                str(pre.X.dtype),
+                f"{np.abs(pre.X - reference.X).max():.1e}",
+            )
+            for name, pre, run_time, kept, peak in results
+        ],
+    )
+
+    pre = results[-1][1]
+    initial = create_model().get_weights()
+
+    results, reference = [], None
+    for policy in ["float32", "mixed_bfloat16"]:
+        model = create_model(dtype_policy=policy)
+        model.set_weights(initial)
+        model.predict_on_batch(pre.X_test)  # Tracing
+        y_pred, predict_time = timed(model.predict_on_batch, pre.X_test)
+        reference = y_pred if reference is None else reference
+
+        _, fit_time = timed(
+            model.fit,
+            pre.X_train,
+            pre.y_train,
+            batch_size=p.batch_size,
+            epochs=epochs,
+            shuffle=False,
+            verbose=0,
+        )
+        with TemporaryDirectory() as tmp:
+            os.environ["LOGS"] = tmp
+            evaluator = Evaluator(
+                pre.y_test,
+                model.predict_on_batch(pre.X_test).flatten(),
+                normalizer=pre.normalizer,
+            )
+            evaluator.run()
+
+        results.append(
+            (
+                policy,
+                len(pre.X_train) * epochs / fit_time,
+                len(pre.X_test) / predict_time,
+                f"{np.abs(y_pred - reference).max():.1e}",
+                float(evaluator.metrics["rmse"]),
+            )
+        )
+
+    report(
+        f"Política de dtype do modelo ({epochs} epochs a partir dos mesmos pesos)",
+        ["política", "treino (jan/s)", "previsão (jan/s)", "erro máx.", "RMSE teste"],
+        results,
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parser_windowing = subparsers.add_parser(
+        "windowing", help="Compare Preprocessor windowing against the legacy loop."
+    )
+    parser_windowing.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser_windowing.set_defaults(run=lambda args: windowing(args.rows))
+
+    parser_denoise = subparsers.add_parser(
+        "denoise", help="Compare the batched wavelet transform against the column loop."
+    )
+    parser_denoise.add_argument("--rows", type=int, default=10_000)
+    parser_denoise.add_argument("--tickers", type=int, nargs="+", default=[1, 10, 50])
+    parser_denoise.set_defaults(run=lambda args: denoise(args.rows, args.tickers))
+
+    parser_causal = subparsers.add_parser(
+        "causal",
+        help="Causal wavelet transform, including inputs shorter than a window.",
+    )
+    parser_causal.add_argument(
+        "--rows", type=int, nargs="+", default=[100, p.causal_window, 10_000]
+    )
+    parser_causal.set_defaults(run=lambda args: causal(args.rows))
+
+    parser_input_pipeline = subparsers.add_parser(
+        "input-pipeline", help="Compare in memory arrays against the tf.data pipeline."
+    )
+    parser_input_pipeline.add_argument("--rows", type=int, default=100_000)
+    parser_input_pipeline.add_argument("--epochs", type=int, default=3)
+    parser_input_pipeline.set_defaults(
+        run=lambda args: input_pipeline(args.rows, args.epochs)
+    )
+
+    parser_attention = subparsers.add_parser(
+        "attention", help="Time the fused attention layers."
+    )
+    parser_attention.add_argument("--steps", type=int, default=200)
+    parser_attention.set_defaults(run=lambda args: attention(args.steps))
+
+    parser_tuning = subparsers.add_parser(
+        "tuning", help="Trials per hour of the tuning executor by worker count."
+    )
+    parser_tuning.add_argument("--trials", type=int, default=8)
+    parser_tuning.add_argument("--epochs", type=int, default=2)
+    parser_tuning.add_argument(
+        "--workers", type=int, nargs="+", default=[1, os.cpu_count()]
+    )
+    parser_tuning.set_defaults(
+        run=lambda args: tuning(args.trials, args.epochs, args.workers)
+    )
+
+    parser_market_data = subparsers.add_parser(
+        "market-data", help="Compare cold and warm loads through the market data cache."
+    )
+    parser_market_data.add_argument(
+        "--online", action="store_true", help="Fetch from Yahoo! Finance."
+    )
+    parser_market_data.add_argument(
+        "--latency", type=float, default=1.0, help="Simulated offline fetch latency."
+    )
+    parser_market_data.set_defaults(
+        run=lambda args: market_data(args.online, args.latency)
+    )
+
+    parser_global_model = subparsers.add_parser(
+        "global-model", help="Compare one model per ticker against a shared model."
+    )
+    parser_global_model.add_argument("--tickers", type=int, default=20)
+    parser_global_model.add_argument("--rows", type=int, default=2_000)
+    parser_global_model.add_argument("--epochs", type=int, default=5)
+    parser_global_model.set_defaults(
+        run=lambda args: global_model(args.tickers, args.rows, args.epochs)
+    )
+
+    parser_backtest = subparsers.add_parser(
+        "backtest", help="Compare the vectorized backtest against the strategy loop."
+    )
+    parser_backtest.add_argument(
+        "--rounds", type=int, nargs="+", default=[250, 2_500, 25_000]
+    )
+    parser_backtest.set_defaults(run=lambda args: backtest(args.rounds))
+
+    parser_simulation = subparsers.add_parser(
+        "simulation", help="Throughput and peak memory of the Monte Carlo simulation."
+    )
+    parser_simulation.add_argument(
+        "--paths", type=int, nargs="+", default=[1_000, 10_000]
+    )
+    parser_simulation.add_argument(
+        "--workers", type=int, nargs="+", default=[1, os.cpu_count()]
+    )
+    parser_simulation.set_defaults(
+        run=lambda args: simulation(args.paths, args.workers)
+    )
+
+    parser_server = subparsers.add_parser(
+        "server", help="Latency of the prediction server against a cold start."
+    )
+    parser_server.add_argument("--requests", type=int, default=200)
+    parser_server.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser_server.set_defaults(run=lambda args: server(args.requests, args.concurrency))
+
+    parser_startup = subparsers.add_parser(
+        "startup", help="Import time of the entry points by package."
+    )
+    parser_startup.add_argument(
+        "--modules",
+        nargs="+",
+        default=[
+            "alstm_stock_market.run",
+            "alstm_stock_market.src.app.app",
+            "alstm_stock_market.src.app.server",
+        ],
+    )
+    parser_startup.add_argument("--top", type=int, default=10)
+    parser_startup.set_defaults(run=lambda args: startup(args.modules, args.top))
+
+    parser_export = subparsers.add_parser(
+        "export", help="Single window latency of the exported graphs against Keras."
+    )
+    parser_export.add_argument("--calls", type=int, default=200)
+    parser_export.add_argument(
+        "--quantization",
+        nargs="+",
+        default=["float32", "int8"],
+        choices=["float32", "int8"],
+    )
+    parser_export.set_defaults(run=lambda args: export(args.calls, args.quantization))
+
+    parser_storage = subparsers.add_parser(
+        "storage", help="Compare per document writes against a single bulk write."
+    )
+    parser_storage.add_argument("--docs", type=int, nargs="+", default=[30, 300, 3_000])
+    parser_storage.add_argument(
+        "--latency", type=float, default=0.05, help="Simulated request latency."
+    )
+    parser_storage.set_defaults(run=lambda args: storage(args.docs, args.latency))
+
+    parser_backfill = subparsers.add_parser(
+        "backfill", help="Compare one app run per date against a single backfill."
+    )
+    parser_backfill.add_argument("--days", type=int, default=250)
+    parser_backfill.add_argument(
+        "--latency", type=float, default=0.5, help="Simulated download latency."
+    )
+    parser_backfill.set_defaults(run=lambda args: backfill(args.days, args.latency))
+
+    parser_walk_forward = subparsers.add_parser(
+        "walk-forward", help="Prediction quality and cost of each retraining policy."
+    )
+    parser_walk_forward.add_argument("--rows", type=int, default=3_000)
+    parser_walk_forward.add_argument("--days", type=int, default=500)
+    parser_walk_forward.add_argument("--epochs", type=int, default=20)
+    parser_walk_forward.set_defaults(
+        run=lambda args: walk_forward(args.rows, args.days, args.epochs)
+    )
+
+    parser_registry = subparsers.add_parser(
+        "registry", help="Compare scanning the weights directory against the registry."
+    )
+    parser_registry.add_argument(
+        "--versions", type=int, nargs="+", default=[10, 100, 1_000]
+    )
+    parser_registry.add_argument("--loads", type=int, default=20)
+    parser_registry.set_defaults(run=lambda args: registry(args.versions, args.loads))
+
+    parser_precision = subparsers.add_parser(
+        "precision", help="Memory, speed and accuracy of each dtype policy."
+    )
+    parser_precision.add_argument("--rows", type=int, default=20_000)
+    parser_precision.add_argument("--epochs", type=int, default=5)
+    parser_precision.set_defaults(run=lambda args: precision(args.rows, args.epochs))
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,44 @@
-import yfinance as yf
-from skopt.space import Categorical, Real
-
 import alstm_stock_market.src.manager.strategies as st
 import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.data.market_data import MarketData
+from alstm_stock_market.src.data.normalizer import Normalizer
 from alstm_stock_market.src.data.preprocessor import Preprocessor
-from alstm_stock_market.src.helpers.plotter import Plotter
-from alstm_stock_market.src.helpers.utils import cmd_args
+from alstm_stock_market.src.helpers.utils import (
+    cmd_args,
+    get_latest_normalizer,
+    save_normalizer,
+)
 from alstm_stock_market.src.manager.manager import Manager
+from alstm_stock_market.src.model.dataset import split_datasets
 from alstm_stock_market.src.model.evaluator import Evaluator
 from alstm_stock_market.src.model.model import Model
+from alstm_stock_market.src.model.registry import WeightsRegistry
 
 
 def main():
-    data = yf.download(p.ticker, start=p.start, end=p.end)
+    data = MarketData().download(p.ticker, p.start, p.end)
+
+    args = cmd_args()
+    normalizer_path = get_latest_normalizer() if args.load_weights else None
 
-    pre = Preprocessor(data, p.sets_sizes)
+    pre = Preprocessor(
+        data,
+        p.sets_sizes,
+        normalizer=Normalizer.load(normalizer_path) if normalizer_path else None,
+    )
     pre.run()
 
-    args = cmd_args()
     model = Model(load_weights=args.load_weights)
 
     if args.tuning:
+        from skopt.space import Categorical, Real
+
         param_grid = {  # Grid search only
             "model__learning_rate": [0.001, 0.01, 0.1],
             "model__hidden_state_size": [10, 20, 50, 100],
             "batch_size": [64, 128, 256, 512],
         }
-        param_space = {  # Bayesian search only
+        param_space = {  # Bayesian search and Hyperband only
             "model__learning_rate": Real(0.0001, 0.01, prior="log-uniform"),
             "model__dropout_rate": Real(0, 0.3),
             "batch_size": Categorical([64, 128, 256, 1024]),
@@ -37,42 +49,66 @@ def main():
             pre.y_train,
             param_grid,
             param_space,
+            args.resume,
         )
         print(
             f"Best score of {best['score']} obtained with parameters {best['params']}.",
-            "Overall results logs saved.",
+            f"{best['trials_per_hour']:.1f} trials per hour, all trials recorded in the trial store.",
         )
         return
 
-    plot = Plotter()
-
-    plot.wavelet_results(pre)
-    plot.wavelet_results_detail(pre)
+    plot = None
+    if not args.no_plots:
+        from alstm_stock_market.src.helpers.plotter import Plotter
+
+        plot = Plotter()
+        plot.wavelet_results(pre)
+        plot.wavelet_results_detail(pre)
+
+    # Days behind the training windows and their targets
+    train_range = [
+        date.strftime("%Y-%m-%d")
+        for date in pre.dates[[0, p.time_step + pre.train_limit - 1]]
+    ]
+    if p.streaming_input:
+        datasets = split_datasets(pre)
+        model.fit(
+            datasets["train"],
+            None,
+            datasets["valdn"],
+            None,
+            args.resume,
+            train_range=train_range,
+        )
+    else:
+        model.fit(
+            pre.X_train,
+            pre.y_train,
+            pre.X_valdn,
+            pre.y_valdn,
+            args.resume,
+            train_range=train_range,
+        )
+    if not args.load_weights:
+        save_normalizer(pre.normalizer)
+    if args.export:
+        from alstm_stock_market.src.model.export import export_latest
 
-    model.fit(
-        pre.X_train,
-        pre.y_train,
-        pre.X_valdn,
-        pre.y_valdn,
-    )
+        print("Modelo exportado em", export_latest(model.model, args.export))
 
-    if not args.load_weights:
+    if plot and not args.load_weights:
         plot.learning_curve(model)
 
     pred_train = model.predict(pre.X_train)
     pred_valdn = model.predict(pre.X_valdn)
     pred_test = model.predict(pre.X_test)
 
-    plot.prediction_train(pre, pred_train)
-    plot.prediction_valdn(pre, pred_valdn)
-    plot.prediction_test(pre, pred_test)
+    if plot:
+        plot.prediction_train(pre, pred_train)
+        plot.prediction_valdn(pre, pred_valdn)
+        plot.prediction_test(pre, pred_test)
 
-    evaluator = Evaluator(
-        pre.y_test,
-        pred_test,
-        pre.target_norm_mean,
-        pre.target_norm_std,
-    )
+    evaluator = Evaluator(pre.y_test, pred_test, normalizer=pre.normalizer)
     evaluator.run()
 
     print("\nAvaliação dos Resultados:")
@@ -80,40 +116,40 @@ def main():
     print("Erro Absoluto Médio:", evaluator.metrics["mae"])
     print("R-quadrado:", evaluator.metrics["r2"])
     print("Tracking Error:", evaluator.metrics["te"])
+    if not args.load_weights:
+        WeightsRegistry().annotate(
+            model.version,
+            metrics={name: float(value) for name, value in evaluator.metrics.items()},
+        )
 
-    plot.returns_trend_distribution(evaluator.y_trend, evaluator.y_pred_trend)
-    plot.confusion_matrix(evaluator.confusion_matrix)
-    plot.cumulative_return(pre, evaluator.cumulative_return)
-    plot.cumulative_return_spread(pre, evaluator.cumulative_return)
+    if plot:
+        plot.returns_trend_distribution(evaluator.y_trend, evaluator.y_pred_trend)
+        plot.confusion_matrix(evaluator.confusion_matrix)
+        plot.cumulative_return(pre, evaluator.cumulative_return)
+        plot.cumulative_return_spread(pre, evaluator.cumulative_return)
 
     initial_cash = 1000
     initital_bet = 100
 
+    strategies = st.default_strategies(initial_cash, initital_bet)
+
     manager = Manager(
         initial_cash, initital_bet, evaluator.y_pred_trend, evaluator.y_return
     )
+    results = manager.run_all(strategies)
+    if plot:
+        for name, result in results.items():
+            plot.strategy(result, name)
 
-    strategies = {
-        "Martingale": st.Martingale(initital_bet),
-        "Paroli": st.Paroli(initital_bet),
-        "D'Alembert": st.DAlembert(initital_bet),
-        "Apostas Fixas": st.Fixed(initital_bet),
-        "Apostas Proporcionais (10%)": st.Proportional(initial_cash, proportion=0.10),
-        "Apostas Proporcionais (25%)": st.Proportional(initial_cash, proportion=0.25),
-        "Apostas Proporcionais (50%)": st.Proportional(initial_cash, proportion=0.50),
-        "Apostas Proporcionais (75%)": st.Proportional(initial_cash, proportion=0.75),
-        "Apostas Proporcionais (90%)": st.Proportional(initial_cash, proportion=0.90),
-    }
-
-    for name, strategy in strategies.items():
-        manager = Manager(
-            initial_cash,
-            strategy.initial_bet,
-            evaluator.y_pred_trend,
-            evaluator.y_return,
+    simulation = manager.simulate(strategies)
+
+    print(f"\nSimulação Monte Carlo ({p.simulation_paths} trajetórias):")
+    for name, summary in simulation.items():
+        print(
+            f"{name}: probabilidade de ruína {summary['ruin_probability']:.2%},",
+            f"caixa mediano R$ {summary['bankroll_quantiles'][0.5]:.2f},",
+            f"drawdown (95%) {summary['drawdown_quantiles'][0.95]:.2%}",
         )
-        results = manager.run(strategy)
-        plot.strategy(results, name)
 
 
 if __name__ == "__main__":
@@ -1,28 +1,69 @@
 import os
+from argparse import ArgumentParser
 from datetime import datetime, timedelta
 
 import dotenv
 import numpy as np
-import yfinance as yf
+import pandas as pd
 from bizdays import Calendar
-from cloudant.client import Cloudant
+from numpy.lib.stride_tricks import sliding_window_view
 
 import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.app.storage import open_storage
+from alstm_stock_market.src.data.market_data import MarketData
+from alstm_stock_market.src.data.normalizer import Normalizer
 from alstm_stock_market.src.data.preprocessor import Preprocessor
-from alstm_stock_market.src.helpers.utils import log_app, reverse_normalize
+from alstm_stock_market.src.data.wavelet import (
+    StreamingDenoiser,
+    causal_wavelet_denoise,
+    wavelet_denoise,
+)
+from alstm_stock_market.src.helpers.utils import (
+    get_latest_normalizer,
+    log_app,
+    save_normalizer,
+)
+from alstm_stock_market.src.model.dataset import split_datasets
+from alstm_stock_market.src.model.export import load_serving_model
 from alstm_stock_market.src.model.model import Model
 
 dotenv.load_dotenv()
 
 
+def save_changes(storage, changes, messages):
+    """Write the changed docs in a single bulk request, returning how many succeeded."""
+    docs = list(changes.values())
+    written = 0
+    for doc, status in zip(docs, storage.bulk_write(docs)):
+        message = messages[doc["date"]]
+        if "error" in status:
+            result = {
+                "status": "error",
+                "message": f"{message} failed: {status['error']}",
+                "data": doc,
+            }
+        else:
+            doc.update(_id=status["id"], _rev=status["rev"])
+            result = {"status": "success", "message": message, "data": doc}
+            written += 1
+        log_app(result)
+    return written
+
+
 class App:
-    def __init__(self, pred_date=None):
+    def __init__(self, pred_date=None, storage=None, market_data=None):
         self.pred_date = (
             pred_date
             if pred_date is not None
             else (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
         )
         self.calendar = Calendar.load(filename=os.environ["CALENDAR"])
+        self.market_data = market_data or MarketData()
+        self.storage = storage
+
+        # Weights saved before normalizers existed fall back to window statistics
+        normalizer_path = get_latest_normalizer()
+        self.normalizer = Normalizer.load(normalizer_path) if normalizer_path else None
 
         if not self.calendar.isbizday(self.pred_date):
             result = {
@@ -32,9 +73,14 @@ class App:
             log_app(result)
             raise ValueError(result)
 
+        # Causal denoising needs a full window of history behind every input day,
+        # one extra p.time_step covers the rows Preprocessor may trim
+        self.history_size = (
+            p.causal_window + 2 * p.time_step if p.causal_denoise else p.time_step
+        )
         self.interval_start = self.calendar.offset(
             self.pred_date,
-            -(p.time_step+1),
+            -(self.history_size + 1),
         ).strftime("%Y-%m-%d")
 
         self.days_since_training = self.calendar.diff(
@@ -45,17 +91,31 @@ class App:
         )[0]
 
     def _incremental_fit(self):
-        train_data = yf.download(
+        train_data = self.market_data.download(
             p.ticker,
-            start=os.environ["MAX_TRAINING_DATE"],
-            end=self.pred_date,
+            os.environ["MAX_TRAINING_DATE"],
+            self.pred_date,
         )
 
-        pre = Preprocessor(train_data, {"train": 1, "valdn": 0, "test": 0})
+        # New rows join the statistics before training, so the saved pair
+        # scales inputs as the fine-tuned weights were trained
+        pre = Preprocessor(
+            train_data,
+            {"train": 1, "valdn": 0, "test": 0},
+            normalizer=self.normalizer,
+            update_normalizer=True,
+        )
         pre.run()
 
         model = Model(load_weights=True)
-        model.incremental_train(pre.X_train, pre.y_train)
+        train_range = [date.strftime("%Y-%m-%d") for date in pre.dates[[0, -1]]]
+        if p.streaming_input:
+            model.incremental_train(split_datasets(pre)["train"], None, train_range)
+        else:
+            model.incremental_train(pre.X_train, pre.y_train, train_range)
+
+        if self.normalizer:
+            save_normalizer(self.normalizer)
 
         os.environ["MAX_TRAINING_DATE"] = pre.dates[-1].strftime("%Y-%m-%d")
         dotenv.set_key(
@@ -65,117 +125,85 @@ class App:
         )
 
     def _make_prediction(self):
-        pred_data = yf.download(
+        pred_data = self.market_data.download(
             p.ticker,
-            start=self.interval_start,
-            end=self.pred_date,
-        ).tail(p.time_step)
+            self.interval_start,
+            self.pred_date,
+        ).tail(self.history_size)
 
-        if len(pred_data) < p.time_step:
+        if len(pred_data) < self.history_size:
             result = {
                 "status": "error",
-                "message": f"Expected {p.time_step} days for {self.pred_date}, got {len(pred_data)}",
+                "message": f"Expected {self.history_size} days for {self.pred_date}, got {len(pred_data)}",
             }
             log_app(result)
             raise ValueError(result)
 
-        self.close_prices = pred_data["Close"]
-
-        pre = Preprocessor(pred_data, {"train": 0, "valdn": 0, "test": 1})
-        pre.run()
-
-        model = Model(load_weights=True)
-        y_pred = model.predict(pre.X_test)
-        self.pred_close = np.round(
-            reverse_normalize(
-                y_pred[0],
-                pre.target_norm_mean,
-                pre.target_norm_std,
-            ),
-            2,
-        )
-
-    def _connect(self):
-        self.client = Cloudant(
-            os.environ["CLOUDANT_USERNAME"],
-            os.environ["CLOUDANT_API_KEY"],
-            url=os.environ["CLOUDANT_URL"],
-            connect=True,
-        )
-        self.database = self.client.create_database(
-            os.environ["DATABASE"],
-            throw_on_exists=False,
-        )
-        result = self.database.get_view_result(
-            "_design/sp500View",
-            "by-date",
-            startkey=self.interval_start,
-            endkey=self.pred_date,
-            include_docs=True,
-        )
-        self.interval_docs = [d["doc"] for d in result]
+        self.close_prices = pred_data["Close"].tail(p.time_step)
+
+        if p.causal_denoise and self.normalizer:
+            # Only the input rows are denoised, each over its own causal window
+            denoiser = StreamingDenoiser().extend(
+                pred_data.dropna().to_numpy(np.float64)
+            )
+            window = self.normalizer.transform(denoiser.rows.astype(p.dtype))
+            normalizer = self.normalizer
+        else:
+            pre = Preprocessor(
+                pred_data,
+                {"train": 0, "valdn": 0, "test": 1},
+                normalizer=self.normalizer,
+            )
+            pre.run()
+            window, normalizer = pre.values[-p.time_step :], pre.normalizer
+
+        # The exported graph skips rebuilding the Keras model for one window
+        model = load_serving_model() if p.serving_format else Model(load_weights=True)
+        y_pred = model.predict(window[np.newaxis])
+        self.pred_close = np.round(normalizer.inverse_transform_target(y_pred[0]), 2)
 
     def _write_prediction(self):
-        for doc in self.interval_docs:
-            if doc["date"] == self.pred_date:
-                if np.isclose(doc["pred_close"], self.pred_close):
-                    result = {
-                        "status": "success",
-                        "message": f"Prediction for {self.pred_date} already exists, no update needed",
-                        "data": doc,
-                    }
-                    log_app(result)
-                    return
-
-                doc["pred_close"] = self.pred_close
-                self.database[doc["_id"]].update(doc)
-                self.database[doc["_id"]].save()
-
-                result = {
-                    "status": "success",
-                    "message": f"Updated prediction for {self.pred_date}",
-                    "data": doc,
-                }
-                log_app(result)
-                return
-
-        doc = self.database.create_document(
-            {
+        doc = self.docs.get(self.pred_date)
+        if doc is None:
+            self.changes[self.pred_date] = {
                 "date": self.pred_date,
                 "pred_close": self.pred_close,
             }
-        )
-        result = {
-            "status": "success",
-            "message": f"Created prediction for {self.pred_date}",
-            "data": doc,
-        }
-        log_app(result)
+            self.messages[self.pred_date] = f"Created prediction for {self.pred_date}"
+            return
+
+        if np.isclose(doc["pred_close"], self.pred_close):
+            result = {
+                "status": "success",
+                "message": f"Prediction for {self.pred_date} already exists, no update needed",
+                "data": doc,
+            }
+            log_app(result)
+            return
+
+        doc["pred_close"] = self.pred_close
+        self.changes[self.pred_date] = doc
+        self.messages[self.pred_date] = f"Updated prediction for {self.pred_date}"
 
     def _write_close_prices(self):
+        # Fetched docs are indexed by date, so each close is a single lookup
         for date, price in self.close_prices.items():
-            for doc in self.interval_docs:
-                if doc["date"] == date.strftime("%Y-%m-%d"):
-                    self.interval_docs.remove(doc)
-
-                    if ("close" not in doc) or (not np.isclose(doc["close"], price)):
-                        doc["close"] = price
-                        self.database[doc["_id"]].update(doc)
-                        self.database[doc["_id"]].save()
-                        result = {
-                            "status": "success",
-                            "message": f"Updated close for {date}",
-                            "data": doc,
-                        }
-                        log_app(result)
-                        break
-
-                    result = {
-                        "status": "success",
-                        "message": f"Close for {date} already exists, no update needed",
-                        "data": doc,
-                    }
-                    break
+            date = date.strftime("%Y-%m-%d")
+            doc = self.docs.get(date)
+            if doc is None:
+                continue
+
+            if ("close" not in doc) or (not np.isclose(doc["close"], price)):
+                doc["close"] = price
+                self.changes[date] = doc
+                self.messages[date] = f"Updated close for {date}"
+
+    def _sync(self):
+        self.docs = self.storage.fetch(self.interval_start, self.pred_date)
+        self.changes, self.messages = {}, {}
+        self._write_prediction()
+        self._write_close_prices()
+        save_changes(self.storage, self.changes, self.messages)
 
     def run(self):
         if self.days_since_training >= p.batch_size:
@@ -184,17 +212,180 @@ class App:
         self._make_prediction()
 
         try:
-            self._connect()
-            self._write_prediction()
-            self._write_close_prices()
+            self.storage = self.storage or open_storage()
+            self._sync()
         except Exception as e:
             print(e)
         finally:
-            self.client.disconnect()
+            if self.storage:
+                self.storage.close()
+
+
+class Backfill:
+    """Predictions for every business day of a range, in one batched pass."""
+
+    def __init__(self, start, end, storage=None, market_data=None):
+        self.calendar = Calendar.load(filename=os.environ["CALENDAR"])
+        self.market_data = market_data or MarketData()
+        self.storage = storage
+
+        normalizer_path = get_latest_normalizer()
+        self.normalizer = Normalizer.load(normalizer_path) if normalizer_path else None
+
+        self.start, self.end = start, end
+        self.pred_dates = pd.DatetimeIndex(self.calendar.seq(start, end))
+        if self.pred_dates.empty:
+            raise ValueError(f"No business days between {start} and {end}.")
+
+        # Same history per date as App, behind the first date of the range
+        self.history_size = (
+            p.causal_window + 2 * p.time_step if p.causal_denoise else p.time_step
+        )
+        self.interval_start = self.calendar.offset(
+            start,
+            -(self.history_size + 1),
+        ).strftime("%Y-%m-%d")
+
+    def _download(self):
+        # A single download for the whole range, one day past end keeps its close
+        self.data = self.market_data.download(
+            p.ticker,
+            self.interval_start,
+            (pd.Timestamp(self.end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        ).dropna()
+
+    def _windows(self):
+        # Rows strictly before each date, as App downloads them for a single date
+        stops = self.data.index.searchsorted(self.pred_dates)
+        missing = stops < self.history_size
+        for date, stop in zip(self.pred_dates[missing], stops[missing]):
+            result = {
+                "status": "error",
+                "message": f"Expected {self.history_size} days for {date.date()}, got {stop}",
+            }
+            log_app(result)
+        self.pred_dates, stops = self.pred_dates[~missing], stops[~missing]
+
+        if p.causal_denoise and self.normalizer is None:
+            return self._preprocessed_windows(stops)
+
+        values = self.data.to_numpy(dtype=np.float64)
+        if p.causal_denoise:
+            # Each causal row only sees its past, so one pass over the whole
+            # series yields the rows of every window
+            values = causal_wavelet_denoise(values)
+        windows = sliding_window_view(values, self.history_size, axis=0).transpose(
+            0, 2, 1
+        )[stops - self.history_size]
+
+        if p.causal_denoise:
+            # Rows Preprocessor trims from a single date's history
+            windows = windows[:, (self.history_size - 1) % p.time_step :]
+        else:
+            windows = wavelet_denoise(windows, axis=1)
+        windows = windows.astype(p.dtype)
+
+        # Without a saved normalizer App falls back to each window's statistics.
+        # Both stay float64 for the inverse transform, only X is in p.dtype
+        if self.normalizer:
+            mean, std = self.normalizer.mean, self.normalizer.std
+        else:
+            mean = windows.mean(axis=1, dtype=np.float64, keepdims=True)
+            std = windows.std(axis=1, dtype=np.float64, ddof=1, keepdims=True)
+
+        target = list(self.data.columns).index(p.target)
+        self.target_mean = np.broadcast_to(mean, windows.shape)[:, -1, target]
+        self.target_std = np.broadcast_to(std, windows.shape)[:, -1, target]
+        self.X = (windows - mean.astype(p.dtype)) / std.astype(p.dtype)
+        self.X = self.X[:, -p.time_step :]
+
+    def _preprocessed_windows(self, stops):
+        # Window statistics would include causal warm-up rows, which differ per
+        # window, so each date is preprocessed on its own as App does
+        X, self.target_mean, self.target_std = [], [], []
+        for stop in stops:
+            pre = Preprocessor(
+                self.data.iloc[stop - self.history_size : stop],
+                {"train": 0, "valdn": 0, "test": 1},
+            )
+            pre.run()
+            X.append(pre.values[-p.time_step :])
+            self.target_mean.append(pre.target_norm_mean)
+            self.target_std.append(pre.target_norm_std)
+        self.X = np.stack(X)
+        self.target_mean = np.array(self.target_mean)
+        self.target_std = np.array(self.target_std)
+
+    def _predict(self):
+        # One batched call for every date of the range
+        model = load_serving_model() if p.serving_format else Model(load_weights=True)
+        y_pred = model.predict(self.X)
+        self.pred_closes = np.round(self.target_std * y_pred + self.target_mean, 2)
+
+    def _sync(self):
+        self.docs = self.storage.fetch(self.interval_start, self.end)
+        self.changes, self.messages = {}, {}
+
+        closes = self.data["Close"]
+        for date, pred_close in zip(self.pred_dates, self.pred_closes):
+            key = date.strftime("%Y-%m-%d")
+            doc = self.docs.get(key, {"date": key})
+            created = "_id" not in doc
+
+            changed = "pred_close" not in doc or not np.isclose(
+                doc["pred_close"], pred_close
+            )
+            doc["pred_close"] = pred_close
+            if date in closes.index and (
+                "close" not in doc or not np.isclose(doc["close"], closes[date])
+            ):
+                doc["close"] = closes[date]
+                changed = True
+
+            if changed:
+                self.changes[key] = doc
+                self.messages[
+                    key
+                ] = f"{'Created' if created else 'Updated'} backfill for {key}"
+
+        self.written = save_changes(self.storage, self.changes, self.messages)
+
+    def run(self):
+        self._download()
+        self._windows()
+        self._predict()
+
+        # Storage failures propagate, a backfill that wrote nothing must not pass
+        self.storage = self.storage or open_storage()
+        try:
+            self._sync()
+        finally:
+            self.storage.close()
+
+        print(
+            f"{len(self.pred_dates)} previsões de {self.start} a {self.end},",
+            f"{self.written} de {len(self.changes)} documentos gravados.",
+        )
+        if self.written < len(self.changes):
+            raise RuntimeError(
+                f"{len(self.changes) - self.written} backfill documents failed, see the app log."
+            )
 
 
 def main():
-    App().run()
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("START", "END"),
+        help="Predict every business day from START to END, inclusive, in one batch.",
+    )
+    args = parser.parse_args()
+
+    if args.backfill:
+        Backfill(*args.backfill).run()
+    else:
+        App().run()
 
 
 if __name__ == "__main__":
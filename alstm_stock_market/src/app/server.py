@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+import dotenv
+import numpy as np
+import pandas as pd
+from bizdays import Calendar
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.data.market_data import MarketData
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.data.preprocessor import Preprocessor
+from alstm_stock_market.src.data.wavelet import StreamingDenoiser
+from alstm_stock_market.src.helpers.utils import get_latest_normalizer, log_app
+from alstm_stock_market.src.model.export import load_serving_model
+from alstm_stock_market.src.model.model import Model
+
+dotenv.load_dotenv()
+
+
+class MicroBatcher:
+    """Collect windows from concurrent requests into a single model call."""
+
+    def __init__(self, model, max_batch=None, max_wait=None):
+        self.model = model
+        self.max_batch = max_batch or p.server_max_batch
+        self.max_wait = max_wait if max_wait is not None else p.server_batch_wait
+        self.queue = Queue()
+        self.calls = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, window):
+        future = Future()
+        self.queue.put((window, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                # Wait briefly for concurrent requests once the first one arrives
+                while len(batch) < self.max_batch:
+                    batch.append(self.queue.get(timeout=self.max_wait))
+            except Empty:
+                pass
+
+            windows, futures = zip(*batch)
+            try:
+                y_pred = self.model.predict_on_batch(np.stack(windows)).flatten()
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            self.calls += 1
+            for future, value in zip(futures, y_pred):
+                future.set_result(value)
+
+
+class Predictor:
+    """Model, calendar, normalizer and price history kept loaded between requests."""
+
+    def __init__(self, market_data=None, model=None):
+        self.calendar = Calendar.load(filename=os.environ["CALENDAR"])
+        self.market_data = market_data or MarketData()
+
+        normalizer_path = get_latest_normalizer()
+        self.normalizer = Normalizer.load(normalizer_path) if normalizer_path else None
+
+        # Same history as App, causal denoising needs a full window behind every day
+        self.history_size = (
+            p.causal_window + 2 * p.time_step if p.causal_denoise else p.time_step
+        )
+        self.model = model or (
+            load_serving_model() if p.serving_format else Model(load_weights=True).model
+        )
+        self.batcher = MicroBatcher(self.model)
+
+        self.lock = threading.Lock()
+        self.prices = None
+        self.predictions = {}
+
+        # Denoised rows of the last history, consecutive dates push one bar
+        self.stream_lock = threading.Lock()
+        self.denoiser = None
+
+    def _stale(self, start, end):
+        if self.prices is None or start < self.prices_start or end > self.prices_end:
+            return True
+        # Today's bar may still change, so ranges reaching it expire
+        today = pd.Timestamp.today().normalize()
+        return self.prices_end > today and (
+            perf_counter() - self.prices_time > p.server_prices_ttl
+        )
+
+    def _history(self, pred_date):
+        interval_start = pd.Timestamp(
+            self.calendar.offset(
+                pred_date.strftime("%Y-%m-%d"), -(self.history_size + 1)
+            )
+        )
+
+        with self.lock:
+            if self._stale(interval_start, pred_date):
+                start = interval_start
+                if self.prices is not None:
+                    start = min(start, self.prices_start)
+                end = (
+                    max(pred_date, self.prices_end)
+                    if self.prices is not None
+                    else pred_date
+                )
+
+                self.prices = self.market_data.download(p.ticker, start, end)
+                self.prices_start, self.prices_end = start, end
+                self.prices_time = perf_counter()
+                self.predictions = {}
+            # Predictions made from these prices, dropped with them on a refresh
+            prices, predictions = self.prices, self.predictions
+
+        data = prices[
+            (interval_start <= prices.index) & (prices.index < pred_date)
+        ].tail(self.history_size)
+        return data, predictions
+
+    def _causal_rows(self, data):
+        values = data.dropna().to_numpy(dtype=np.float64)
+        with self.stream_lock:
+            raw = self.denoiser.raw if self.denoiser else values[:0]
+            # Same history again, or the next date's with one more bar
+            if len(raw) and np.array_equal(raw, values[-len(raw) :]):
+                return self.denoiser.rows
+            if len(raw) and np.array_equal(raw, values[-len(raw) - 1 : -1]):
+                self.denoiser.push(values[-1])
+            else:
+                self.denoiser = StreamingDenoiser().extend(values)
+            return self.denoiser.rows
+
+    def _window(self, pred_date, data):
+        if len(data) < self.history_size:
+            raise ValueError(
+                f"Expected {self.history_size} days for {pred_date.date()}, got {len(data)}"
+            )
+
+        if p.causal_denoise and self.normalizer:
+            rows = self._causal_rows(data).astype(p.dtype)
+            return self.normalizer.transform(rows), self.normalizer
+
+        pre = Preprocessor(
+            data,
+            {"train": 0, "valdn": 0, "test": 1},
+            normalizer=self.normalizer,
+        )
+        pre.run()
+        return pre.values[-p.time_step :], pre.normalizer
+
+    def predict(self, pred_date):
+        if not pred_date:
+            raise ValueError("Missing prediction date.")
+        pred_date = pd.Timestamp(pred_date).normalize()
+        if not self.calendar.isbizday(pred_date.strftime("%Y-%m-%d")):
+            raise ValueError(f"{pred_date.date()} is not a business day.")
+
+        data, predictions = self._history(pred_date)
+        with self.lock:
+            pred_close = predictions.get(pred_date)
+        if pred_close is not None:
+            return pred_close
+
+        window, normalizer = self._window(pred_date, data)
+        y_pred = self.batcher.submit(window).result()
+
+        pred_close = round(float(normalizer.inverse_transform_target(y_pred)), 2)
+        with self.lock:
+            predictions[pred_date] = pred_close
+        return pred_close
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # The default backlog of 5 makes bursts of clients wait for SYN retries
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def handler(predictor):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self._send(200, {"status": "success"})
+            if url.path != "/predict":
+                return self._send(404, {"status": "error", "message": "Not found"})
+
+            date = parse_qs(url.query).get("date", [None])[0]
+            try:
+                pred_close = predictor.predict(date)
+            except ValueError as error:
+                return self._send(400, {"status": "error", "message": str(error)})
+            except Exception as error:
+                # Download or model failures, the client still gets a response
+                log_app({"status": "error", "message": f"{date}: {error!r}"})
+                return self._send(500, {"status": "error", "message": str(error)})
+            self._send(
+                200, {"status": "success", "date": date, "pred_close": pred_close}
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", default=p.server_host)
+    parser.add_argument("--port", type=int, default=p.server_port)
+    args = parser.parse_args()
+
+    server = PredictionServer((args.host, args.port), handler(Predictor()))
+    print(
+        f"Servidor de previsões em http://{args.host}:{args.port}/predict?date=AAAA-MM-DD"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
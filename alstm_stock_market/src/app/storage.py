@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import uuid
+
+import alstm_stock_market.src.model.params as p
+
+
+class CloudantStorage:
+    """Daily documents in IBM Cloudant, read by date and written in one request."""
+
+    def __init__(self):
+        from cloudant.client import Cloudant
+
+        self.client = Cloudant(
+            os.environ["CLOUDANT_USERNAME"],
+            os.environ["CLOUDANT_API_KEY"],
+            url=os.environ["CLOUDANT_URL"],
+            connect=True,
+        )
+        self.database = self.client.create_database(
+            os.environ["DATABASE"],
+            throw_on_exists=False,
+        )
+
+    def fetch(self, start, end):
+        result = self.database.get_view_result(
+            "_design/sp500View",
+            "by-date",
+            startkey=start,
+            endkey=end,
+            include_docs=True,
+        )
+        return {row["doc"]["date"]: row["doc"] for row in result}
+
+    def bulk_write(self, docs):
+        # A single _bulk_docs round-trip, one {id, rev} or {id, error} per doc
+        return self.database.bulk_docs(docs) if docs else []
+
+    def close(self):
+        self.client.disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SQLiteStorage:
+    """Local stand-in for Cloudant with the same revisions and conflicts."""
+
+    def __init__(self, path=None):
+        # ":memory:" keeps the documents only for the life of the object
+        self.path = path or os.path.join(os.environ["LOGS"], "storage.sqlite")
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                rev TEXT NOT NULL,
+                date TEXT,
+                doc TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS docs_date ON docs (date)")
+
+    def fetch(self, start, end):
+        rows = self.connection.execute(
+            "SELECT doc FROM docs WHERE date BETWEEN ? AND ? ORDER BY date",
+            (start, end),
+        )
+        return {doc["date"]: doc for doc in (json.loads(row[0]) for row in rows)}
+
+    def bulk_write(self, docs):
+        results = []
+        with self.connection:
+            for doc in docs:
+                doc_id = doc.get("_id") or uuid.uuid4().hex
+                row = self.connection.execute(
+                    "SELECT rev FROM docs WHERE id = ?", (doc_id,)
+                ).fetchone()
+
+                # As in CouchDB, updates must name the revision they replace
+                if (row[0] if row else None) != doc.get("_rev"):
+                    results.append(
+                        {
+                            "id": doc_id,
+                            "error": "conflict",
+                            "reason": "Document update conflict.",
+                        }
+                    )
+                    continue
+
+                generation = int(row[0].split("-")[0]) + 1 if row else 1
+                rev = f"{generation}-{uuid.uuid4().hex}"
+                stored = {**doc, "_id": doc_id, "_rev": rev}
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO docs (id, rev, date, doc) VALUES (?, ?, ?, ?)",
+                    (doc_id, rev, stored.get("date"), json.dumps(stored)),
+                )
+                results.append({"id": doc_id, "rev": rev})
+        return results
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_storage(backend=None):
+    backends = {"cloudant": CloudantStorage, "sqlite": SQLiteStorage}
+    backend = backend or p.storage_backend
+    if backend not in backends:
+        raise ValueError(
+            f"Invalid storage backend. Valid backends are: {', '.join(backends.keys())}"
+        )
+    return backends[backend]()
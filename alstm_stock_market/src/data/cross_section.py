@@ -0,0 +1,82 @@
+import numpy as np
+import tensorflow as tf
+
+import alstm_stock_market.src.model.params as p
+
+
+class CrossSection:
+    """Windows of many tickers interleaved by date, for one shared model."""
+
+    def __init__(self, preprocessors, ids=None):
+        # ids maps each ticker to its embedding row, by default its position
+        self.preprocessors = preprocessors
+        self.tickers = list(preprocessors)
+        self.ids = ids or {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.target_col_idx = next(iter(preprocessors.values())).target_col_idx
+
+        # Every ticker's rows in one array, windows are addressed by start row
+        self.values = np.concatenate([pre.values for pre in preprocessors.values()])
+        offsets = np.cumsum([0] + [len(pre.values) for pre in preprocessors.values()])
+
+        self.sets = {}
+        for name in ["train", "valdn", "test"]:
+            starts, ids, dates = [], [], []
+            for i, (ticker, pre) in enumerate(preprocessors.items()):
+                start, stop = {
+                    "train": (0, pre.train_limit),
+                    "valdn": (pre.train_limit, pre.valdn_limit),
+                    "test": (pre.valdn_limit, len(pre.y)),
+                }[name]
+                starts.append(offsets[i] + np.arange(start, stop))
+                ids.append(np.full(stop - start, self.ids[ticker], dtype=np.int32))
+                dates.append(pre.dates[p.time_step + start : p.time_step + stop])
+
+            starts, ids = np.concatenate(starts), np.concatenate(ids)
+            dates = np.concatenate([d.to_numpy(dtype="datetime64[ns]") for d in dates])
+
+            # By target date, then ticker, so every batch spans the cross section
+            order = np.lexsort((ids, dates))
+            self.sets[name] = {
+                "starts": starts[order],
+                "ids": ids[order],
+                "dates": dates[order],
+            }
+
+    def X(self, name):
+        return self.values[
+            self.sets[name]["starts"][:, np.newaxis] + np.arange(p.time_step)
+        ]
+
+    def y(self, name):
+        return self.values[self.sets[name]["starts"] + p.time_step, self.target_col_idx]
+
+    def inputs(self, name, embedding=True):
+        return [self.X(name), self.sets[name]["ids"]] if embedding else self.X(name)
+
+    def dataset(self, name, embedding=True, batch_size=None):
+        """Same batches as inputs and y, windowed lazily with tf.data."""
+        # Sliced once here, a slice inside map would copy the column every batch
+        targets = tf.constant(self.values[:, self.target_col_idx])
+        values = tf.constant(self.values)
+        offsets = tf.range(p.time_step, dtype=tf.int64)
+
+        def gather_windows(starts, ids):
+            X = tf.gather(values, starts[:, tf.newaxis] + offsets)
+            y = tf.gather(targets, starts + p.time_step)
+            return ((X, ids) if embedding else X), y
+
+        return (
+            tf.data.Dataset.from_tensor_slices(
+                (self.sets[name]["starts"], self.sets[name]["ids"])
+            )
+            .batch(batch_size or p.global_batch_size)
+            .map(
+                gather_windows, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True
+            )
+            .prefetch(tf.data.AUTOTUNE)
+        )
+
+    def split(self, name, values):
+        """Per ticker slices of values ordered like the name set, back in date order."""
+        ids = self.sets[name]["ids"]
+        return {ticker: values[ids == self.ids[ticker]] for ticker in self.tickers}
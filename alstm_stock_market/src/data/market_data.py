@@ -0,0 +1,107 @@
+import json
+import os
+import re
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def yahoo_fetcher(ticker, start, end):
+    import yfinance as yf
+
+    return yf.download(ticker, start=start, end=end, progress=False)
+
+
+class LocalFetcher:
+    """Serve prices from local frames instead of the network, for offline runs."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.calls = []
+
+    @classmethod
+    def from_csv(cls, paths):
+        return cls(
+            {
+                ticker: pd.read_csv(path, index_col=0, parse_dates=True)
+                for ticker, path in paths.items()
+            }
+        )
+
+    def __call__(self, ticker, start, end):
+        self.calls.append((ticker, start, end))
+        data = self.frames[ticker]
+        return data[(start <= data.index) & (data.index < end)]
+
+
+class MarketData:
+    """Per ticker Parquet cache in front of a fetcher, only missing days are fetched."""
+
+    def __init__(self, fetcher=yahoo_fetcher, cache_dir=None):
+        self.fetcher = fetcher
+        self.cache_dir = os.path.join(cache_dir or os.environ["CACHE"], "market")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, ticker):
+        name = re.sub(r"[^\w.-]", "_", ticker)
+        return (
+            os.path.join(self.cache_dir, f"{name}.parquet"),
+            os.path.join(self.cache_dir, f"{name}.json"),
+        )
+
+    def _load(self, ticker):
+        data_path, meta_path = self._paths(ticker)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, None
+
+        with open(meta_path) as file:
+            meta = json.load(file)
+        covered = (pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"]))
+        return pd.read_parquet(data_path), covered
+
+    def _save(self, ticker, data, covered):
+        data_path, meta_path = self._paths(ticker)
+        data.to_parquet(data_path)
+        with open(meta_path, "w") as file:
+            json.dump(
+                {"start": str(covered[0].date()), "end": str(covered[1].date())}, file
+            )
+
+    def _missing(self, covered, start, end):
+        if covered is None:
+            return [(start, end)]
+
+        missing = []
+        if start < covered[0]:
+            missing.append((start, covered[0]))
+        if end > covered[1]:
+            missing.append((covered[1], end))
+        return missing
+
+    def download(self, ticker, start, end):
+        # As in yf.download, end is exclusive
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        data, covered = self._load(ticker)
+
+        missing = self._missing(covered, start, end)
+        fetched = [
+            self.fetcher(ticker, s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d"))
+            for s, e in missing
+        ]
+
+        if fetched:
+            data = pd.concat([f for f in [data, *fetched] if f is not None])
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+
+            # Today's bar may still change, so it's never considered covered
+            today = pd.Timestamp.today().normalize()
+            covered_start = start if covered is None else min(start, covered[0])
+            covered_end = min(end, today)
+            if covered is not None:
+                covered_end = max(covered_end, covered[1])
+
+            self._save(ticker, data, (covered_start, covered_end))
+
+        return data[(start <= data.index) & (data.index < end)]
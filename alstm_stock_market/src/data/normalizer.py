@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+from alstm_stock_market.src.helpers.stats import RunningMoments
+
+
+class Normalizer:
+    """Z-score normalization from running moments, persisted next to the weights."""
+
+    def __init__(self, target_col_idx, moments=None):
+        self.target_col_idx = target_col_idx
+        self.moments = moments or RunningMoments()
+
+    def update(self, values):
+        self.moments.update(values)
+        return self
+
+    @property
+    def mean(self):
+        return self.moments.mean
+
+    @property
+    def std(self):
+        return self.moments.std
+
+    @property
+    def target_mean(self):
+        return self.mean[self.target_col_idx]
+
+    @property
+    def target_std(self):
+        return self.std[self.target_col_idx]
+
+    def transform(self, values):
+        # Statistics in the dtype of values, float32 data is never upcast
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else None
+        return (values - self.mean.astype(dtype)) / self.std.astype(dtype)
+
+    def inverse_transform_target(self, values):
+        return self.target_std * values + self.target_mean
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "target_col_idx": self.target_col_idx,
+                    "count": self.moments.count,
+                    "mean": self.moments.mean.tolist(),
+                    "m2": self.moments.m2.tolist(),
+                },
+                file,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            state = json.load(file)
+        moments = RunningMoments(state["count"], state["mean"], state["m2"])
+        return cls(state["target_col_idx"], moments)
@@ -1,16 +1,32 @@
+import os
+
 import numpy as np
 import pandas as pd
-import pywt
+from numpy.lib.stride_tricks import sliding_window_view
 
 import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.data.wavelet import causal_wavelet_denoise, wavelet_denoise
+from alstm_stock_market.src.helpers.cache import DiskCache, fingerprint
 
 
 class Preprocessor:
-    def __init__(self, data, sets_sizes):
+    def __init__(
+        self, data, sets_sizes, cache=True, normalizer=None, update_normalizer=False
+    ):
         self.data = self._trim(data.dropna())
         self.dates = self.data.index
         self.target_col_idx = list(self.data.columns).index(p.target)
         self.sets_sizes = sets_sizes
+        self.normalizer = normalizer
+        self.update_normalizer = update_normalizer
+        self.cache = (
+            DiskCache(
+                os.path.join(os.environ["CACHE"], "wavelet"), p.wavelet_cache_size
+            )
+            if cache
+            else None
+        )
 
     def _trim(self, data):
         if len(data) <= p.time_step:
@@ -26,58 +42,68 @@ class Preprocessor:
         return data.iloc[trim_len:, :]
 
     def _denoise(self):
-        def calc_universal_threshold(finnest_coeffs):
-            sigma = np.std(finnest_coeffs)
-            n = len(finnest_coeffs)
-            return sigma * np.sqrt(2 * np.log(n))
+        # Same raw data and wavelet params always yield the same transform
+        key = fingerprint(
+            self.data.to_numpy(),
+            list(self.data.columns),
+            p.wavelet,
+            p.wavelet_mode,
+            p.levels,
+            p.shrink_coeffs,
+            p.threshold_mode,
+            p.causal_denoise and p.causal_window,
+        )
+        transformed = self.cache.get(key) if self.cache else None
+
+        if transformed is None:
+            values = self.data.to_numpy(dtype=np.float64)
+            transformed = (
+                causal_wavelet_denoise(values)
+                if p.causal_denoise
+                else wavelet_denoise(values)
+            )
+            if self.cache:
+                self.cache.set(key, transformed)
 
+        # Denoised in float64, every array from here on is in p.dtype
         self.data_transformed = pd.DataFrame(
+            transformed.astype(p.dtype, copy=False),
             index=self.data.index,
             columns=self.data.columns,
         )
 
-        for col in self.data.columns:
-            coeffs = pywt.wavedec(
-                self.data[col],
-                p.wavelet,
-                p.wavelet_mode,
-                level=p.levels,
-            )
-            for i, shrink in enumerate(p.shrink_coeffs):
-                if shrink:
-                    threlshold = calc_universal_threshold(coeffs[-1])
-                    coeffs[i] = pywt.threshold(coeffs[i], threlshold, p.threshold_mode)
-
-            self.data_transformed[col] = pywt.waverec(
-                coeffs,
-                p.wavelet,
-                p.wavelet_mode,
-            )[: len(self.data.index)]
-
     def _normalize(self):
-        norm_mean = self.data_transformed.mean()
-        norm_std = self.data_transformed.std()
-        self.target_norm_mean = norm_mean.iloc[self.target_col_idx]
-        self.target_norm_std = norm_std.iloc[self.target_col_idx]
-
-        self.data_normalized = (self.data_transformed - norm_mean) / norm_std
+        # A given normalizer keeps the scale the model was trained on, unless
+        # the model is about to be trained on these rows too
+        if self.normalizer is None:
+            self.normalizer = Normalizer(self.target_col_idx).update(
+                self.data_transformed.to_numpy()
+            )
+        elif self.update_normalizer:
+            self.normalizer.update(self.data_transformed.to_numpy())
+        self.target_norm_mean = self.normalizer.target_mean
+        self.target_norm_std = self.normalizer.target_std
+
+        self.data_normalized = pd.DataFrame(
+            self.normalizer.transform(self.data_transformed.to_numpy()),
+            index=self.data_transformed.index,
+            columns=self.data_transformed.columns,
+        )
 
     def _sequentialize(self):
-        if len(self.data_normalized) <= p.time_step:
-            self.X = np.array([self.data_normalized])
-            self.y = np.array([])
-            return
+        self.values = self.data_normalized.to_numpy(dtype=p.dtype)
+        self.values.flags.writeable = False
 
-        X_seq = []
-        y_seq = []
-        for i in range(len(self.data_normalized) - p.time_step):
-            X = self.data_normalized.iloc[i : i + p.time_step, :]
-            y = self.data_normalized.iloc[i + p.time_step, self.target_col_idx]
-            X_seq.append(X)
-            y_seq.append(y)
+        if len(self.values) <= p.time_step:
+            self.X = self.values[np.newaxis]
+            self.y = np.array([], dtype=p.dtype)
+            return
 
-        self.X = np.array(X_seq)
-        self.y = np.array(y_seq)
+        # Read-only (N, p.time_step, features) view over self.values, nothing
+        # is copied until a consumer requires it
+        windows = sliding_window_view(self.values, p.time_step, axis=0)
+        self.X = windows.transpose(0, 2, 1)[:-1]
+        self.y = self.values[p.time_step :, self.target_col_idx]
 
     def _split(self):
         if not np.isclose(sum(self.sets_sizes.values()), 1.0):
@@ -88,6 +114,9 @@ class Preprocessor:
             np.round(len(self.X) * self.sets_sizes["valdn"])
         )
 
+        self.train_limit = train_limit
+        self.valdn_limit = valdn_limit
+
         self.X_train = self.X[:train_limit]
         self.y_train = self.y[:train_limit]
         self.X_valdn = self.X[train_limit:valdn_limit]
@@ -0,0 +1,84 @@
+import warnings
+
+import numpy as np
+import pywt
+from numpy.lib.stride_tricks import sliding_window_view
+
+import alstm_stock_market.src.model.params as p
+
+
+def wavelet_denoise(values, axis=0):
+    """Denoise every series of values along axis at once."""
+    # pywt filters the last axis fastest when it is contiguous in memory
+    series = np.ascontiguousarray(np.moveaxis(values, axis, -1))
+    coeffs = pywt.wavedec(series, p.wavelet, p.wavelet_mode, level=p.levels, axis=-1)
+
+    # Universal threshold, one per series, from its finest detail coefficients
+    finest_coeffs = coeffs[-1]
+    n = finest_coeffs.shape[-1]
+    threshold = np.std(finest_coeffs, axis=-1, keepdims=True) * np.sqrt(2 * np.log(n))
+
+    for i, shrink in enumerate(p.shrink_coeffs):
+        if shrink:
+            coeffs[i] = pywt.threshold(coeffs[i], threshold, p.threshold_mode)
+
+    transformed = pywt.waverec(coeffs, p.wavelet, p.wavelet_mode, axis=-1)
+    return np.moveaxis(transformed[..., : series.shape[-1]], -1, axis)
+
+
+def _denoise_last(history):
+    # Warm-up histories are shorter than the decomposition levels require
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return wavelet_denoise(history)[-1]
+
+
+def causal_wavelet_denoise(values, window=p.causal_window, chunk_size=4096, start=0):
+    """Denoise each row from start using only itself and the window - 1 rows before it."""
+    # Rows before the first full window use the history they have, which is
+    # every row of an input shorter than window
+    warm_up = [
+        _denoise_last(values[: i + 1])
+        for i in range(start, min(window - 1, len(values)))
+    ]
+
+    # Every full window is transformed in a single batched call per chunk
+    denoised = []
+    first = max(start, window - 1)
+    if len(values) > first:
+        windows = sliding_window_view(values[first - window + 1 :], window, axis=0)
+        denoised = [
+            wavelet_denoise(windows[i : i + chunk_size], axis=-1)[..., -1]
+            for i in range(0, len(windows), chunk_size)
+        ]
+
+    return np.concatenate(
+        [np.reshape(warm_up, (-1, values.shape[1])), *denoised]
+    ).astype(values.dtype, copy=False)
+
+
+class StreamingDenoiser:
+    """Last size rows of causal_wavelet_denoise over a series fed bar by bar."""
+
+    def __init__(self, num_features=p.num_features, window=p.causal_window, size=None):
+        self.window = window
+        self.size = size or p.time_step
+        self.raw = np.empty((0, num_features))
+        self.rows = np.empty((0, num_features))
+
+    def extend(self, bars):
+        history = np.concatenate([self.raw, np.reshape(bars, (-1, self.raw.shape[1]))])
+
+        # Only the bars still among the last size rows are transformed, each
+        # with the window - 1 raw bars kept before it
+        new = min(len(history) - len(self.raw), self.size)
+        denoised = causal_wavelet_denoise(
+            history, self.window, start=len(history) - new
+        )
+
+        self.raw = history[-(self.window - 1) :]
+        self.rows = np.concatenate([self.rows, denoised])[-self.size :]
+        return self
+
+    def push(self, bar):
+        return self.extend(bar)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Content addressed store of arrays, evicting the least recently used ones."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        os.utime(path)  # Access time is not reliable on every filesystem
+        return array
+
+    def set(self, key, array):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        # Other processes may share the directory, entries can vanish at any time
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -2,7 +2,6 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-import alstm_stock_market.src.model.params as p
 from alstm_stock_market.src.helpers.utils import reverse_normalize, save_image
 
 
@@ -190,7 +189,7 @@ class Plotter:
 
     def learning_curve(self, model):
         self._plot_lines(
-            x=np.arange(1, p.epochs + 1, 1),
+            x=np.array(model.fitted.epoch) + 1,
             Y=[model.fitted.history["loss"], model.fitted.history["val_loss"]],
             legends=["Treino", "Validação"],
             legend_pos="tr",
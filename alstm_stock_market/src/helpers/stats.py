@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class RunningMoments:
+    """Mean and variance of a stream of batches, updated in O(1) memory."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=np.float64)
+        if len(batch) == 0:
+            return self
+
+        mean = batch.mean(axis=0)
+        return self.merge(
+            RunningMoments(len(batch), mean, ((batch - mean) ** 2).sum(axis=0))
+        )
+
+    def merge(self, other):
+        # Chan et al. parallel form of Welford's algorithm, merging whole batches
+        if other.count == 0:
+            return self
+
+        delta = other.mean - self.mean
+        total = self.count + other.count
+
+        self.mean = self.mean + delta * other.count / total
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    @property
+    def var(self):
+        # Sample variance, as pandas computes it
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
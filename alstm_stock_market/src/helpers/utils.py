@@ -2,7 +2,9 @@ import os
 from argparse import ArgumentParser
 from datetime import datetime
 
-from plotly.io import write_image
+import numpy as np
+
+from alstm_stock_market.src.model.registry import WeightsRegistry, params_hash
 
 now = datetime.now().strftime("%Y-%m-%d_%H.%M.%S")
 
@@ -13,8 +15,8 @@ def cmd_args():
         "-t",
         "--tuning",
         default=None,
-        choices=["grid", "bayes"],
-        help="Run specified tuning method, choices are 'bayes' for BayesianSearch or 'grid' for GridSearch. Set params in code directly.",
+        choices=["grid", "bayes", "hyperband"],
+        help="Run specified tuning method, choices are 'bayes' for BayesianSearch, 'grid' for GridSearch or 'hyperband' for Hyperband. Set params in code directly.",
     )
     parser.add_argument(
         "-w",
@@ -22,29 +24,114 @@ def cmd_args():
         default=False,
         help="Load saved weights from the most recent previous training session.",
     )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted training session from its last completed epoch, or an interrupted Hyperband search.",
+    )
+    parser.add_argument(
+        "-e",
+        "--export",
+        default=None,
+        choices=["saved_model", "tflite"],
+        help="Export the trained model as a self contained inference graph for the app.",
+    )
+    parser.add_argument(
+        "-n",
+        "--no-plots",
+        action="store_true",
+        help="Skip every plot, plotly is then never imported.",
+    )
     return parser.parse_args()
 
 
-def save_txt(data, name):
-    path = os.path.join(os.environ["LOGS"], f"{now}_{name}.txt")
-    with open(path, "w") as file:
-        file.write(str(data))
+def save_columns(columns, name):
+    # One .npy per column, so any of them can be memory mapped on its own
+    path = os.path.join(os.environ["LOGS"], f"{now}_{name}")
+    os.makedirs(path, exist_ok=True)
+    for column, values in columns.items():
+        np.save(os.path.join(path, f"{column}.npy"), np.asarray(values))
+    return path
+
+
+def load_columns(path, mmap_mode="r"):
+    return {
+        name.removesuffix(".npy"): np.load(
+            os.path.join(path, name), mmap_mode=mmap_mode
+        )
+        for name in sorted(os.listdir(path))
+        if name.endswith(".npy")
+    }
 
 
 def save_image(fig, title):
+    from plotly.io import write_image
+
     path = os.path.join(os.environ["IMAGES"], f"{now}_{title}.svg")
     write_image(fig, path)
 
 
 def get_latest_weights():
-    weights = [w for w in os.listdir(os.environ["WEIGHTS"]) if w.endswith(".h5")]
-    weights.sort()
-    return os.path.join(os.environ["WEIGHTS"], weights[-1])
+    """Weights of the pinned version, or else of the newest one."""
+    return WeightsRegistry().path()
 
 
-def save_weights(model):
+def save_weights(model, train_range=None, metrics=None):
+    """Save and register the weights of model, returning their version."""
     path = os.path.join(os.environ["WEIGHTS"], f"{now}_weights.h5")
     model.save_weights(path)
+    return WeightsRegistry().register(
+        os.path.basename(path), train_range, params_hash(), metrics
+    )
+
+
+def get_latest_normalizer(directory=None):
+    directory = directory or os.environ["WEIGHTS"]
+    # The normalizer saved with the current weights, so a rollback restores both
+    try:
+        weights = WeightsRegistry(directory).get()
+    except FileNotFoundError:
+        weights = None
+    if weights:
+        name = f"{weights['file'].removesuffix('_weights.h5')}_normalizer.json"
+        if os.path.exists(os.path.join(directory, name)):
+            return os.path.join(directory, name)
+        # Another version's normalizer would scale inputs the weights never saw
+        print(
+            f"AVISO: pesos v{weights['version']} sem normalizador próprio,",
+            "usando as estatísticas de cada janela",
+        )
+        return None
+
+    normalizers = [n for n in os.listdir(directory) if n.endswith("_normalizer.json")]
+    if not normalizers:
+        return None
+    normalizers.sort()
+    return os.path.join(directory, normalizers[-1])
+
+
+def save_normalizer(normalizer, directory=None):
+    path = os.path.join(directory or os.environ["WEIGHTS"], f"{now}_normalizer.json")
+    normalizer.save(path)
+
+
+def get_backup_dir():
+    return os.path.join(os.environ["WEIGHTS"], "backup")
+
+
+def get_checkpoint_path():
+    # Kept with the backup, so a resumed run continues from the same best
+    return os.path.join(get_backup_dir(), "best.h5")
+
+
+def set_tensorflow_threads(threads):
+    # Must run before TensorFlow creates its thread pools in this process
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
 
 
 def reverse_normalize(data, mean, std):
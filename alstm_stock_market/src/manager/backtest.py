@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def _groups(strategies):
+    # Strategies of the same class are made adjacent, so each class advances
+    # through one vectorized call on a contiguous slice of columns
+    order = sorted(
+        range(len(strategies)), key=lambda s: type(strategies[s]).__qualname__
+    )
+    groups, start = [], 0
+    while start < len(order):
+        cls = type(strategies[order[start]])
+        stop = start
+        while stop < len(order) and type(strategies[order[stop]]) is cls:
+            stop += 1
+        params = {
+            name: np.array([getattr(strategies[s], name) for s in order[start:stop]])
+            for name in cls.vector_params
+        }
+        groups.append((cls, slice(start, stop), params))
+        start = stop
+    return np.array(order), groups
+
+
+def backtest(strategies, trend_predictions, market_returns, initial_cash):
+    """Run every strategy over every path of returns at once.
+
+    Predictions and returns are (T,) or (P, T) arrays of P paths. Results are
+    time major, (T + 1, P, S) for S strategies, NaN after a strategy is ruined.
+    """
+    preds = np.atleast_2d(trend_predictions)
+    returns = np.atleast_2d(market_returns).astype(np.float64)
+    (n_paths, n_rounds), n_strategies = returns.shape, len(strategies)
+    order, groups = _groups(strategies)
+
+    shape = (n_paths, n_strategies)
+    bankroll = np.full((n_rounds + 1, *shape), np.nan)
+    bets = np.full((n_rounds + 1, *shape), np.nan)
+    gains_losses = np.full((n_rounds, *shape), np.nan)
+    win = np.empty(shape, dtype=bool)
+
+    bankroll[0] = initial_cash
+    bets[0] = [strategies[s].initial_bet for s in order]
+    current_bet = bets[0].copy()
+
+    # Long: win when return > 0, lose otherwise; Short: win when return < 0, lose otherwise
+    pct_gain_loss = np.where(preds, returns, -returns).T[..., np.newaxis]
+
+    # A ruined strategy can only bet zero from then on, so its columns stay at
+    # zero without masking and are cut after the loop
+    for t in range(n_rounds):
+        np.multiply(bets[t], pct_gain_loss[t], out=gains_losses[t])
+        np.add(bankroll[t], gains_losses[t], out=bankroll[t + 1])
+        np.maximum(bankroll[t + 1], 0, out=bankroll[t + 1])
+        if not bankroll[t + 1].any():
+            break
+
+        np.greater_equal(gains_losses[t], 0, out=win)
+        for cls, columns, params in groups:
+            current_bet[:, columns], bets[t + 1][:, columns] = cls.next_bets(
+                win[:, columns],
+                bankroll[t + 1][:, columns],
+                current_bet[:, columns],
+                **params
+            )
+
+    ruin = bankroll[1:] == 0
+    ruined = ruin.any(axis=0)
+    # Without any round nothing is ruined, and argmax has no row to pick
+    rounds = (
+        np.where(ruined, ruin.argmax(axis=0) + 1, n_rounds)
+        if n_rounds
+        else np.zeros(shape, dtype=int)
+    )
+
+    time = np.arange(n_rounds + 1)[:, np.newaxis, np.newaxis]
+    bankroll[time > rounds] = np.nan
+    bets[time > rounds - ruined] = np.nan
+    gains_losses[time[:-1] >= rounds] = np.nan
+
+    # Back to the caller's strategy order
+    columns = np.argsort(order)
+    results = {
+        "bankroll": bankroll[..., columns],
+        "bets": bets[..., columns],
+        "gains_losses": gains_losses[..., columns],
+        "rounds": rounds[..., columns],
+        "ruined": ruined[..., columns],
+    }
+    if np.ndim(market_returns) == 1:
+        results = {k: v[..., 0, :] if v.ndim == 3 else v[0] for k, v in results.items()}
+    return results
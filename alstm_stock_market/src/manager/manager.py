@@ -1,4 +1,8 @@
-from alstm_stock_market.src.helpers.utils import save_txt
+import numpy as np
+
+from alstm_stock_market.src.helpers.utils import save_columns
+from alstm_stock_market.src.manager.backtest import backtest
+from alstm_stock_market.src.manager.simulation import simulate
 
 
 class Manager:
@@ -6,32 +10,67 @@ class Manager:
         self.trend_preds = trend_predictions
         self.returns = market_returns
 
-        self.bankroll = [initial_cash]
-        self.bets = [initial_bet]
-        self.gains_losses = []
+        self.initial_cash = initial_cash
+        self.initial_bet = initial_bet
 
     def run(self, strategy):
-        for pred, pct_change in zip(self.trend_preds, self.returns):
+        n_rounds = len(self.returns)
+        bankroll = np.empty(n_rounds + 1)
+        bets = np.empty(n_rounds + 1)
+        gains_losses = np.empty(n_rounds)
+
+        bankroll[0] = self.initial_cash
+        bets[0] = self.initial_bet
+        rounds, ruined = n_rounds, False
+
+        for t, (pred, pct_change) in enumerate(zip(self.trend_preds, self.returns)):
             # Long: win when return > 0, lose otherwise; Short: win when return < 0, lose otherwise
             pct_gain_loss = pct_change if pred else -pct_change
 
-            self.gains_losses.append(self.bets[-1] * pct_gain_loss)
-            self.bankroll.append(max(self.bankroll[-1] + self.gains_losses[-1], 0))
+            gains_losses[t] = bets[t] * pct_gain_loss
+            bankroll[t + 1] = max(bankroll[t] + gains_losses[t], 0)
 
-            if self.bankroll[-1] == 0:
+            if bankroll[t + 1] == 0:
+                rounds, ruined = t + 1, True
                 break
 
-            self.bets.append(
-                strategy.next_bet(
-                    win=self.gains_losses[-1] >= 0,
-                    current_cash=self.bankroll[-1],
-                )
+            bets[t + 1] = strategy.next_bet(
+                win=gains_losses[t] >= 0,
+                current_cash=bankroll[t + 1],
             )
 
         results = {
-            "bankroll": self.bankroll,
-            "bets": self.bets,
-            "gains_losses": self.gains_losses,
+            "bankroll": bankroll[: rounds + 1],
+            "bets": bets[: rounds + 1 - ruined],
+            "gains_losses": gains_losses[:rounds],
         }
-        save_txt(results, strategy.name)
+        save_columns(results, strategy.name)
         return results
+
+    def run_all(self, strategies):
+        """Same results as run for every strategy, from a single backtest pass."""
+        columns = backtest(
+            list(strategies.values()),
+            self.trend_preds,
+            self.returns,
+            self.initial_cash,
+        )
+        save_columns({**columns, "names": list(strategies.keys())}, "backtest")
+
+        all_results = {}
+        for s, name in enumerate(strategies.keys()):
+            rounds, ruined = columns["rounds"][s], columns["ruined"][s]
+            all_results[name] = {
+                "bankroll": columns["bankroll"][: rounds + 1, s],
+                "bets": columns["bets"][: rounds + 1 - ruined, s],
+                "gains_losses": columns["gains_losses"][:rounds, s],
+            }
+        return all_results
+
+    def simulate(self, strategies, **kwargs):
+        """Ruin probability, bankroll and drawdown distributions over bootstrapped paths."""
+        stats = simulate(
+            strategies, self.trend_preds, self.returns, self.initial_cash, **kwargs
+        )
+        save_columns(stats.columns(list(strategies.keys())), "simulation")
+        return stats.summary(list(strategies.keys()))
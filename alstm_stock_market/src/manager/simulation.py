@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.stats import RunningMoments
+from alstm_stock_market.src.manager.backtest import backtest
+
+
+def block_bootstrap(trend_predictions, market_returns, n_paths, block_size, rng):
+    """Resample (prediction, return) pairs in circular blocks of consecutive days."""
+    n_rounds = len(market_returns)
+    n_blocks = -(-n_rounds // block_size)
+
+    starts = rng.integers(0, n_rounds, (n_paths, n_blocks, 1))
+    idx = ((starts + np.arange(block_size)) % n_rounds).reshape(n_paths, -1)
+    idx = idx[:, :n_rounds]
+    return np.asarray(trend_predictions)[idx], np.asarray(market_returns)[idx]
+
+
+class SimulationStats:
+    """Streaming aggregates of simulated paths, merged across batches."""
+
+    def __init__(self, n_strategies, initial_cash, bins=p.simulation_bins):
+        self.initial_cash = initial_cash
+        self.paths = 0
+        self.ruined = np.zeros(n_strategies, dtype=np.int64)
+        self.bankroll = RunningMoments()
+
+        # Log scale bins, a bankroll around the initial cash and drawdowns from
+        # 1e-6, with ruin alone in the first bankroll and last drawdown bins
+        self.bankroll_edges = np.concatenate(
+            [[0], initial_cash * np.geomspace(1e-4, 1e4, bins - 1), [np.inf]]
+        )
+        self.drawdown_edges = np.concatenate(
+            [[0], np.geomspace(1e-6, 1, bins - 1), [np.inf]]
+        )
+        self.bankroll_hist = np.zeros((n_strategies, bins), dtype=np.int64)
+        self.drawdown_hist = np.zeros((n_strategies, bins), dtype=np.int64)
+
+    @staticmethod
+    def _histogram(values, edges):
+        # One bincount for every strategy column at once
+        n_bins = len(edges) - 1
+        bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+        bins += n_bins * np.arange(values.shape[1])
+        return np.bincount(bins.ravel(), minlength=n_bins * values.shape[1]).reshape(
+            values.shape[1], n_bins
+        )
+
+    def update(self, results):
+        # NaN marks the rounds after ruin, so a missing final bankroll is zero
+        final = np.nan_to_num(results["bankroll"][-1])
+        peak = np.fmax.accumulate(results["bankroll"], axis=0)
+        drawdown = np.where(
+            results["ruined"], 1.0, np.nanmax(1 - results["bankroll"] / peak, axis=0)
+        )
+
+        self.paths += len(final)
+        self.ruined += results["ruined"].sum(axis=0)
+        self.bankroll.update(final)
+        self.bankroll_hist += self._histogram(final, self.bankroll_edges)
+        self.drawdown_hist += self._histogram(drawdown, self.drawdown_edges)
+        return self
+
+    def merge(self, other):
+        self.paths += other.paths
+        self.ruined += other.ruined
+        self.bankroll.merge(other.bankroll)
+        self.bankroll_hist += other.bankroll_hist
+        self.drawdown_hist += other.drawdown_hist
+        return self
+
+    @staticmethod
+    def _quantiles(hist, edges, quantiles):
+        # Lower edge of the bin where the cumulative count reaches each quantile
+        cumulative = np.cumsum(hist, axis=1) / hist.sum(axis=1, keepdims=True)
+        return np.array(
+            [edges[:-1][np.argmax(cumulative >= q - 1e-12, axis=1)] for q in quantiles]
+        ).T
+
+    def columns(self, names):
+        return {
+            "names": names,
+            "paths": self.paths,
+            "ruined": self.ruined,
+            "bankroll_mean": self.bankroll.mean,
+            "bankroll_std": self.bankroll.std,
+            "bankroll_edges": self.bankroll_edges,
+            "bankroll_hist": self.bankroll_hist,
+            "drawdown_edges": self.drawdown_edges,
+            "drawdown_hist": self.drawdown_hist,
+        }
+
+    def summary(self, names, quantiles=(0.05, 0.5, 0.95)):
+        bankroll_q = self._quantiles(self.bankroll_hist, self.bankroll_edges, quantiles)
+        drawdown_q = self._quantiles(self.drawdown_hist, self.drawdown_edges, quantiles)
+        return {
+            name: {
+                "paths": self.paths,
+                "ruin_probability": self.ruined[s] / self.paths,
+                "bankroll_mean": self.bankroll.mean[s],
+                "bankroll_std": self.bankroll.std[s],
+                "bankroll_quantiles": dict(zip(quantiles, bankroll_q[s])),
+                "drawdown_quantiles": dict(zip(quantiles, drawdown_q[s])),
+            }
+            for s, name in enumerate(names)
+        }
+
+
+def _simulate_batch(
+    strategies,
+    trend_predictions,
+    market_returns,
+    initial_cash,
+    n_paths,
+    block_size,
+    seed,
+):
+    preds, returns = block_bootstrap(
+        trend_predictions,
+        market_returns,
+        n_paths,
+        block_size,
+        np.random.default_rng(seed),
+    )
+    results = backtest(strategies, preds, returns, initial_cash)
+    return SimulationStats(len(strategies), initial_cash).update(results)
+
+
+def simulate(
+    strategies,
+    trend_predictions,
+    market_returns,
+    initial_cash,
+    n_paths=None,
+    block_size=None,
+    batch_size=None,
+    n_workers=None,
+    seed=0,
+):
+    """Bootstrapped paths through every strategy, only aggregates are kept."""
+    n_paths = n_paths or p.simulation_paths
+    block_size = block_size or p.simulation_block_size
+    n_workers = n_workers or p.simulation_workers or os.cpu_count()
+    strategies = (
+        list(strategies.values()) if isinstance(strategies, dict) else strategies
+    )
+
+    # Bankroll, bets, gains and losses, drawdown and peak of a batch are
+    # float64 arrays of (rounds + 1, paths, strategies)
+    path_bytes = 5 * 8 * (len(market_returns) + 1) * len(strategies)
+    batch_size = batch_size or max(1, p.simulation_batch_memory // path_bytes)
+
+    batches = [
+        (min(batch_size, n_paths - start), batch_seed)
+        for start, batch_seed in zip(
+            range(0, n_paths, batch_size),
+            np.random.SeedSequence(seed).generate_state(-(-n_paths // batch_size)),
+        )
+    ]
+    args = (strategies, trend_predictions, market_returns, initial_cash)
+
+    stats = SimulationStats(len(strategies), initial_cash)
+    if n_workers == 1:
+        for size, batch_seed in batches:
+            stats.merge(_simulate_batch(*args, size, block_size, batch_seed))
+        return stats
+
+    with ProcessPoolExecutor(n_workers, mp_context=get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_simulate_batch, *args, size, block_size, batch_seed)
+            for size, batch_seed in batches
+        ]
+        # Merged in submission order, the same seed gives the same statistics
+        # whatever the number of workers
+        for future in futures:
+            stats.merge(future.result())
+    return stats
@@ -1,6 +1,11 @@
+import numpy as np
+
+
 class Martingale:
     """Double the bet after each loss, return to initial bet after each win."""
 
+    vector_params = ("initial_bet",)
+
     def __init__(self, initial_bet):
         self.name = "martingale"
         self.initial_bet = initial_bet
@@ -10,10 +15,17 @@ class Martingale:
         self.current_bet = self.initial_bet if win else self.current_bet * 2
         return min(self.current_bet, current_cash)
 
+    @staticmethod
+    def next_bets(win, current_cash, current_bet, initial_bet):
+        current_bet = np.where(win, initial_bet, current_bet * 2)
+        return current_bet, np.minimum(current_bet, current_cash)
+
 
 class Paroli:  # Reverse Martingale
     """Double the bet after each win, return to initial bet after each loss."""
 
+    vector_params = ("initial_bet",)
+
     def __init__(self, initial_bet):
         self.name = "paroli"
         self.initial_bet = initial_bet
@@ -23,10 +35,17 @@ class Paroli:  # Reverse Martingale
         self.current_bet = self.initial_bet if not win else self.current_bet * 2
         return min(self.current_bet, current_cash)
 
+    @staticmethod
+    def next_bets(win, current_cash, current_bet, initial_bet):
+        current_bet = np.where(win, current_bet * 2, initial_bet)
+        return current_bet, np.minimum(current_bet, current_cash)
+
 
 class DAlembert:
     """Increase bet by initial bet after each loss, decrease by initial bet after each win."""
 
+    vector_params = ("initial_bet",)
+
     def __init__(self, initial_bet):
         self.name = "dalembert"
         self.initial_bet = initial_bet
@@ -40,10 +59,21 @@ class DAlembert:
         )
         return min(self.current_bet, current_cash)
 
+    @staticmethod
+    def next_bets(win, current_cash, current_bet, initial_bet):
+        current_bet = np.where(
+            win,
+            np.maximum(initial_bet, current_bet - initial_bet),
+            current_bet + initial_bet,
+        )
+        return current_bet, np.minimum(current_bet, current_cash)
+
 
 class Fixed:
     """Always the same bet."""
 
+    vector_params = ("initial_bet",)
+
     def __init__(self, initial_bet):
         self.name = "fixed"
         self.initial_bet = initial_bet
@@ -51,10 +81,16 @@ class Fixed:
     def next_bet(self, win, current_cash):
         return min(self.initial_bet, current_cash)
 
+    @staticmethod
+    def next_bets(win, current_cash, current_bet, initial_bet):
+        return current_bet, np.minimum(initial_bet, current_cash)
+
 
 class Proportional:
     """Bet a proportion of the current cash."""
 
+    vector_params = ("initial_bet", "proportion")
+
     def __init__(self, initial_cash, proportion):
         self.name = f"proportional_{proportion}"
         self.cash = initial_cash
@@ -66,3 +102,27 @@ class Proportional:
         self.cash = current_cash
         self.current_bet = self.cash * self.proportion
         return min(self.current_bet, current_cash)
+
+    @staticmethod
+    def next_bets(win, current_cash, current_bet, initial_bet, proportion):
+        current_bet = current_cash * proportion
+        return current_bet, np.minimum(current_bet, current_cash)
+
+
+def proportional_grid(initial_cash, proportions=np.arange(1, 100) / 100):
+    return {
+        f"Apostas Proporcionais ({proportion:.0%})": Proportional(
+            initial_cash, proportion
+        )
+        for proportion in proportions
+    }
+
+
+def default_strategies(initial_cash, initial_bet):
+    return {
+        "Martingale": Martingale(initial_bet),
+        "Paroli": Paroli(initial_bet),
+        "D'Alembert": DAlembert(initial_bet),
+        "Apostas Fixas": Fixed(initial_bet),
+        **proportional_grid(initial_cash, [0.10, 0.25, 0.50, 0.75, 0.90]),
+    }
@@ -0,0 +1,35 @@
+import tensorflow as tf
+
+import alstm_stock_market.src.model.params as p
+
+
+def windowed_dataset(values, target_col_idx, start=0, stop=None, batch_size=None):
+    """Batches of (X, y) windows over values, built lazily and kept in order."""
+    stop = len(values) - p.time_step if stop is None else stop
+    # Sliced once here, a slice inside map would copy the column every batch
+    targets = tf.constant(values[:, target_col_idx])
+    values = tf.constant(values)
+    offsets = tf.range(p.time_step, dtype=tf.int64)
+
+    def gather_windows(idx):
+        X = tf.gather(values, idx[:, tf.newaxis] + offsets)
+        y = tf.gather(targets, idx + p.time_step)
+        return X, y
+
+    return (
+        tf.data.Dataset.range(start, stop)
+        .batch(batch_size or p.batch_size)
+        .map(gather_windows, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def split_datasets(pre, batch_size=None):
+    return {
+        name: windowed_dataset(pre.values, pre.target_col_idx, start, stop, batch_size)
+        for name, (start, stop) in {
+            "train": (0, pre.train_limit),
+            "valdn": (pre.train_limit, pre.valdn_limit),
+            "test": (pre.valdn_limit, len(pre.X)),
+        }.items()
+    }
@@ -1,14 +1,22 @@
 import numpy as np
 
-from alstm_stock_market.src.helpers.utils import save_txt
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.utils import save_columns
 
 
 class Evaluator:
-    def __init__(self, y, y_pred, normalization_mean=None, normalization_std=None):
-        self.mean = normalization_mean
-        self.std = normalization_std
-        self.y = self._reverse_normalize(y)
-        self.y_pred = self._reverse_normalize(y_pred)
+    def __init__(
+        self,
+        y,
+        y_pred,
+        normalization_mean=None,
+        normalization_std=None,
+        normalizer=None,
+    ):
+        self.mean = normalizer.target_mean if normalizer else normalization_mean
+        self.std = normalizer.target_std if normalizer else normalization_std
+        self.y = self._reverse_normalize(np.asarray(y, dtype=p.dtype))
+        self.y_pred = self._reverse_normalize(np.asarray(y_pred, dtype=p.dtype))
         self.y_return = self._return(self.y)
         self.y_pred_return = self._return(self.y_pred)
 
@@ -42,7 +50,7 @@ class Evaluator:
             "r2": r2(),
             "te": te(),
         }
-        save_txt(self.metrics, "metrics")
+        save_columns(self.metrics, "metrics")
 
     def _calc_confusion_matrix(self):
         self.y_trend = self.y_return >= 0
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.utils import get_latest_weights
+from alstm_stock_market.src.model.registry import model_cache
+
+
+def export_path(weights_path, serving_format, quantization=None):
+    # Exports are named after their weights, so new weights are never served stale
+    stem = weights_path.removesuffix("_weights.h5")
+    if serving_format == "saved_model":
+        return f"{stem}_saved_model"
+    if serving_format == "tflite":
+        return f"{stem}_{quantization or 'float32'}.tflite"
+    raise ValueError(
+        f"Invalid serving format {serving_format}. Valid formats are: saved_model, tflite"
+    )
+
+
+def _serving_function(model, batch_size=None):
+    specs = [
+        tf.TensorSpec((batch_size, *input.shape[1:]), input.dtype, name=input.name)
+        for input in model.inputs
+    ]
+
+    @tf.function(input_signature=specs)
+    def serve(*inputs):
+        return model(list(inputs) if len(inputs) > 1 else inputs[0], training=False)
+
+    return serve
+
+
+def export_model(model, path, serving_format="saved_model", quantization=None):
+    """Self contained inference graph of model, loadable without create_model."""
+    if serving_format == "saved_model":
+        module = tf.Module()
+        module.model = model
+        module.serve = _serving_function(model)
+        tf.saved_model.save(module, path, signatures={"serving_default": module.serve})
+        return path
+
+    # TFLite runs single windows, the lowest latency case on CPU
+    serve = _serving_function(model, batch_size=1)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [serve.get_concrete_function()], model
+    )
+    if quantization == "int8":
+        # Dynamic range, int8 weights with float activations, no calibration data
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantization is not None:
+        # float16 conversion of the LSTM never finishes with TensorFlow 2.14
+        raise ValueError(
+            f"Invalid quantization {quantization}. Valid options are: int8"
+        )
+
+    with open(path, "wb") as file:
+        file.write(converter.convert())
+    return path
+
+
+class ExportedModel:
+    """Predictions from an exported graph, with the interface of the Keras model."""
+
+    def __init__(self, path):
+        self.path = path
+        if path.endswith(".tflite"):
+            self.interpreter = tf.lite.Interpreter(
+                model_path=path, num_threads=os.cpu_count()
+            )
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()
+            self.output_index = self.interpreter.get_output_details()[0]["index"]
+        else:
+            # The loaded object owns the variables, it must outlive serve
+            self.interpreter = None
+            self.saved_model = tf.saved_model.load(path)
+            self.serve = self.saved_model.serve
+
+    def predict_on_batch(self, X):
+        inputs = X if isinstance(X, (list, tuple)) else [X]
+        if self.interpreter is None:
+            return self.serve(*inputs).numpy()
+
+        # The fused TFLite LSTM keeps its state in variables sized for one
+        # window, so windows run one at a time from a zeroed state
+        inputs = [np.asarray(values) for values in inputs]
+        outputs = []
+        for i in range(len(inputs[0])):
+            for detail, values in zip(self.input_details, inputs):
+                self.interpreter.set_tensor(
+                    detail["index"], values[i : i + 1].astype(detail["dtype"])
+                )
+            self.interpreter.reset_all_variables()
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index))
+        return np.concatenate(outputs)
+
+    def predict(self, X):
+        return self.predict_on_batch(X).flatten()
+
+
+def export_latest(model, serving_format=None, quantization=None):
+    """Export model under the name of the current weights."""
+    serving_format = serving_format or p.serving_format or "saved_model"
+    quantization = quantization or p.serving_quantization
+    path = export_path(get_latest_weights(), serving_format, quantization)
+    return export_model(model, path, serving_format, quantization)
+
+
+def load_serving_model(serving_format=None, quantization=None):
+    """Exported graph of the current weights, exported first if missing."""
+    serving_format = serving_format or p.serving_format
+    quantization = quantization or p.serving_quantization
+    path = export_path(get_latest_weights(), serving_format, quantization)
+    if not os.path.exists(path):
+        from alstm_stock_market.src.model.model import Model
+
+        export_model(Model(load_weights=True).model, path, serving_format, quantization)
+    return model_cache.get(path, lambda: ExportedModel(path))
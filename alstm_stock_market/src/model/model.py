@@ -1,18 +1,32 @@
+import os
+import shutil
+
+import numpy as np
+import tensorflow as tf
 import tensorflow.keras.backend as K
 from dotenv import load_dotenv
-from scikeras.wrappers import KerasRegressor
-from sklearn.model_selection import GridSearchCV, TimeSeriesSplit
-from skopt import BayesSearchCV
-from tensorflow.keras.layers import LSTM, Dense, Dropout, Input, Layer
+from tensorflow.keras.callbacks import BackupAndRestore, EarlyStopping, ModelCheckpoint
+from tensorflow.keras.layers import (
+    LSTM,
+    Concatenate,
+    Dense,
+    Dropout,
+    Embedding,
+    Input,
+    Layer,
+    RepeatVector,
+)
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.optimizers import Adam
 
 import alstm_stock_market.src.model.params as p
 from alstm_stock_market.src.helpers.utils import (
+    get_backup_dir,
+    get_checkpoint_path,
     get_latest_weights,
-    save_txt,
     save_weights,
 )
+from alstm_stock_market.src.model.registry import WeightsRegistry, model_cache
 
 load_dotenv()
 
@@ -22,18 +36,42 @@ def create_model(
     dropout_rate=0.12241,
     hidden_state_size=20,
     add_attention=True,
+    fused_attention=p.fused_attention,
+    jit_compile=p.jit_compile,
+    n_tickers=None,
+    embedding_size=p.ticker_embedding_size,
+    dtype_policy=p.dtype_policy,
 ):
-    model = Sequential()
-    model.add(Input(shape=(p.time_step, p.num_features)))
-    model.add(LSTM(hidden_state_size, return_sequences=add_attention))
+    # Weights stay float32 under a mixed policy, only the computations use
+    # its lower precision. The output layer keeps the loss in float32
+    layers = [
+        LSTM(hidden_state_size, return_sequences=add_attention, dtype=dtype_policy)
+    ]
     if add_attention:
-        model.add(ClassicAttention())
-    model.add(Dropout(dropout_rate))
-    model.add(Dense(1, activation="linear"))
+        attention = FusedClassicAttention if fused_attention else ClassicAttention
+        layers.append(attention(dtype=dtype_policy))
+    layers += [
+        Dropout(dropout_rate, dtype=dtype_policy),
+        Dense(1, activation="linear", dtype="float32"),
+    ]
+
+    window = Input(shape=(p.time_step, p.num_features))
+    if n_tickers:
+        # A learned vector per ticker, appended to every day of its windows
+        ticker = Input(shape=(), dtype="int32")
+        embedding = Embedding(n_tickers, embedding_size, dtype=dtype_policy)(ticker)
+        outputs = Concatenate(dtype=dtype_policy)(
+            [window, RepeatVector(p.time_step, dtype=dtype_policy)(embedding)]
+        )
+        for layer in layers:
+            outputs = layer(outputs)
+        model = tf.keras.Model([window, ticker], outputs)
+    else:
+        model = Sequential([window, *layers])
 
     optimizer = Adam(learning_rate=learning_rate)
 
-    model.compile(optimizer=optimizer, loss=p.loss_function)
+    model.compile(optimizer=optimizer, loss=p.loss_function, jit_compile=jit_compile)
     return model
 
 
@@ -43,16 +81,19 @@ class ClassicAttention(Layer):
 
     def build(self, input_shape):
         self.W_Q = self.add_weight(
+            name="W_Q",
             shape=(input_shape[-1], input_shape[-1]),
             initializer="glorot_uniform",
             trainable=True,
         )
         self.W_K = self.add_weight(
+            name="W_K",
             shape=(input_shape[-1], input_shape[-1]),
             initializer="glorot_uniform",
             trainable=True,
         )
         self.W_V = self.add_weight(
+            name="W_V",
             shape=(input_shape[-1], input_shape[-1]),
             initializer="glorot_uniform",
             trainable=True,
@@ -66,7 +107,7 @@ class ClassicAttention(Layer):
 
         QK = K.batch_dot(Q, K.permute_dimensions(K_mat, (0, 2, 1)))
         d_k = K.int_shape(Q)[-1]
-        scaled_attention_logits = QK / K.sqrt(K.cast(d_k, dtype=K.floatx()))
+        scaled_attention_logits = QK / K.sqrt(K.cast(d_k, dtype=self.compute_dtype))
 
         attention_weights = K.softmax(scaled_attention_logits, axis=-1)
         weighted_sum = K.batch_dot(attention_weights, V)
@@ -105,18 +146,146 @@ class TanhAttention(Layer):
         return (input_shape[0], input_shape[-1])
 
 
+def _stacked_glorot_uniform(shape, dtype=None):
+    # Same scale as three separately initialized square projections
+    blocks = shape[-1] // shape[0]
+    return tf.concat(
+        [
+            tf.keras.initializers.GlorotUniform()((shape[0], shape[0]), dtype)
+            for _ in range(blocks)
+        ],
+        axis=-1,
+    )
+
+
+class FusedClassicAttention(Layer):
+    """ClassicAttention with a single QKV projection and no keras.backend ops."""
+
+    def build(self, input_shape):
+        self.W_QKV = self.add_weight(
+            name="W_QKV",
+            shape=(input_shape[-1], 3 * input_shape[-1]),
+            initializer=_stacked_glorot_uniform,
+            trainable=True,
+        )
+        super().build(input_shape)
+
+    def call(self, x):
+        Q, K_mat, V = tf.split(tf.matmul(x, self.W_QKV), 3, axis=-1)
+
+        d_k = tf.cast(tf.shape(Q)[-1], x.dtype)
+        scaled_attention_logits = tf.matmul(Q, K_mat, transpose_b=True) / tf.sqrt(d_k)
+        attention_weights = tf.nn.softmax(scaled_attention_logits, axis=-1)
+
+        # Summing the weighted values over queries is the same as weighting
+        # them by the column sums of the attention matrix. A rank 3 matmul rather
+        # than an einsum, which TFLite lowers to an invalid batch_matmul
+        column_sums = tf.reduce_sum(attention_weights, axis=1, keepdims=True)
+        return tf.squeeze(tf.matmul(column_sums, V), axis=1)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], input_shape[-1])
+
+    @staticmethod
+    def fuse_weights(W_Q, W_K, W_V):
+        return [np.concatenate([W_Q, W_K, W_V], axis=-1)]
+
+
+class FusedTanhAttention(Layer):
+    """TanhAttention with plain TensorFlow ops, compatible with its weights."""
+
+    def build(self, input_shape):
+        self.W_a = self.add_weight(
+            name="W_a",
+            shape=(input_shape[-1], input_shape[-1]),
+            initializer="glorot_uniform",
+            trainable=True,
+        )
+        self.b_a = self.add_weight(
+            name="b_a",
+            shape=(input_shape[-1],),
+            initializer="zeros",
+            trainable=True,
+        )
+        super().build(input_shape)
+
+    def call(self, x):
+        s_t = tf.tanh(tf.matmul(x, self.W_a) + self.b_a)
+        attention_weights = tf.nn.softmax(s_t, axis=1)
+        return tf.reduce_sum(attention_weights * x, axis=1)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], input_shape[-1])
+
+
+def _fit_inputs(X, y, batch_size=None):
+    # Datasets already yield (X, y) batches and set their own batch size
+    if isinstance(X, tf.data.Dataset):
+        return {"x": X}
+    return {"x": X, "y": y, "batch_size": batch_size or p.batch_size}
+
+
 class Model:
-    def __init__(self, load_weights=False):
-        self.model = create_model(p.learning_rate, p.dropout_rate, p.hidden_state_size)
+    def __init__(self, load_weights=False, n_tickers=None, batch_size=None):
+        self.n_tickers = n_tickers
         self.load_weights = load_weights
+        self.batch_size = batch_size or p.batch_size
 
         if self.load_weights:
-            self.model.load_weights(get_latest_weights())
+            # Loaded models are shared within the process, by weights file
+            self.weights_path = get_latest_weights()
+            self.model = model_cache.get(
+                (self.weights_path, n_tickers),
+                lambda: self._loaded_model(self.weights_path),
+            )
+        else:
+            self.model = self._create_model()
+
+    def _create_model(self):
+        # n_tickers adds a ticker input and embedding, for a model shared by many
+        return create_model(
+            p.learning_rate,
+            p.dropout_rate,
+            p.hidden_state_size,
+            n_tickers=self.n_tickers,
+        )
 
-    def tune(self, method, X_train, y_train, param_grid, param_space):
+    def copy(self):
+        """Keras model with the same weights, trainable without touching the cache."""
+        model = self._create_model()
+        model.set_weights(self.model.get_weights())
+        return model
+
+    def _loaded_model(self, path):
+        self.model = self._create_model()
+        self._load_weights(path)
+        return self.model
+
+    def _load_weights(self, path):
+        try:
+            self.model.load_weights(path)
+        except ValueError:
+            # Weights saved with separate Q, K and V projections
+            legacy = create_model(
+                p.learning_rate,
+                p.dropout_rate,
+                p.hidden_state_size,
+                fused_attention=False,
+            )
+            legacy.load_weights(path)
+            for legacy_layer, layer in zip(legacy.layers, self.model.layers):
+                weights = legacy_layer.get_weights()
+                if isinstance(layer, FusedClassicAttention):
+                    weights = FusedClassicAttention.fuse_weights(*weights)
+                layer.set_weights(weights)
+
+    def tune(self, method, X_train, y_train, param_grid, param_space, resume=False):
         methods = {
-            "grid": lambda: self._grid_search(param_grid, X_train, y_train),
-            "bayes": lambda: self._bayesian_search(param_space, X_train, y_train),
+            "grid": lambda: self._grid_search(X_train, y_train, param_grid),
+            "bayes": lambda: self._bayesian_search(X_train, y_train, param_space),
+            "hyperband": lambda: self._hyperband_search(
+                X_train, y_train, param_space, resume
+            ),
         }
 
         try:
@@ -126,90 +295,180 @@ class Model:
                 f"Invalid tuning  method. Valid methods are: {', '.join(methods.keys())}"
             )
 
-    def fit(self, X_train, y_train, X_valdn, y_valdn):
+    def _checkpoint_loss(self, validation_data):
+        model = self._create_model()
+        model.load_weights(get_checkpoint_path())
+        if isinstance(validation_data, tf.data.Dataset):
+            return model.evaluate(validation_data, verbose=0)
+        return model.evaluate(*validation_data, batch_size=self.batch_size, verbose=0)
+
+    def _callbacks(self, resume, validation_data):
+        best = None
+        if not resume:
+            shutil.rmtree(get_backup_dir(), ignore_errors=True)
+        elif os.path.exists(get_checkpoint_path()):
+            # Resumed epochs must beat the interrupted run's best to replace it
+            best = self._checkpoint_loss(validation_data)
+
+        return [
+            # Restores weights, optimizer state and epoch counter of an
+            # interrupted run
+            BackupAndRestore(get_backup_dir()),
+            ModelCheckpoint(
+                get_checkpoint_path(),
+                monitor="val_loss",
+                save_best_only=True,
+                save_weights_only=True,
+                initial_value_threshold=best,
+            ),
+            EarlyStopping(
+                monitor="val_loss",
+                patience=p.patience,
+                restore_best_weights=True,
+            ),
+        ]
+
+    def fit(
+        self,
+        X_train,
+        y_train,
+        X_valdn,
+        y_valdn,
+        resume=False,
+        verbose=1,
+        train_range=None,
+    ):
         if self.load_weights:
             return None
 
+        validation_data = (
+            X_valdn if isinstance(X_valdn, tf.data.Dataset) else (X_valdn, y_valdn)
+        )
         self.fitted = self.model.fit(
-            X_train,
-            y_train,
+            **_fit_inputs(X_train, y_train, self.batch_size),
             epochs=p.epochs,
-            batch_size=p.batch_size,
-            validation_data=(X_valdn, y_valdn),
+            validation_data=validation_data,
             validation_freq=1,
+            callbacks=self._callbacks(resume, validation_data),
             shuffle=False,
-            verbose=1,
-        )
-        save_weights(self.model)
-
-    def _grid_search(self, X_train, y_train, param_grid):
-        estimator = KerasRegressor(
-            model=create_model,
-            epochs=p.epochs,
-            loss=p.loss_function,
-            shuffle=False,
-            verbose=0,
-        )
-        grid_search = GridSearchCV(
-            estimator=estimator,
-            param_grid=param_grid,
-            scoring=f"neg_{p.loss_function}",
-            n_jobs=-1,
-            cv=TimeSeriesSplit(n_splits=3),
+            verbose=verbose,
         )
-        grid_search_result = grid_search.fit(X_train, y_train)
 
-        best = {
-            "score": grid_search_result.best_score_,
-            "params": grid_search_result.best_params_,
-        }
+        # Early stopping only restores the best weights when it fires
+        if os.path.exists(get_checkpoint_path()):
+            self.model.load_weights(get_checkpoint_path())
+        shutil.rmtree(get_backup_dir(), ignore_errors=True)
+        self._save_weights(train_range)
 
-        save_txt(grid_search_result, "GridSearch_results")
-        return best
+    def _save_weights(self, train_range):
+        self.version = save_weights(self.model, train_range)
+        self.weights_path = WeightsRegistry().path(self.version)
+        # The trained model is the new version, later loads reuse it
+        model_cache.put((self.weights_path, self.n_tickers), self.model)
 
-    def _bayesian_search(self, X_train, y_train, param_space):
-        estimator = KerasRegressor(
-            model=create_model,
-            epochs=p.epochs,
-            loss=p.loss_function,
-            shuffle=False,
-            verbose=0,
-        )
-        bayes_search = BayesSearchCV(
-            estimator=estimator,
-            search_spaces=param_space,
-            n_iter=100,
-            scoring=f"neg_{p.loss_function}",
-            n_jobs=-1,
-            cv=TimeSeriesSplit(n_splits=3),
-            refit=True,
-            verbose=2,
-        )
-        bayes_search_result = bayes_search.fit(X_train, y_train)
+    def _grid_search(self, X_train, y_train, param_grid):
+        from sklearn.model_selection import ParameterGrid
+
+        from alstm_stock_market.src.model.trials import TrialStore
+        from alstm_stock_market.src.model.tuning import TuningExecutor
+
+        with TrialStore() as store, TuningExecutor(
+            X_train, y_train, store=store
+        ) as executor:
+            results = executor.evaluate(list(ParameterGrid(param_grid)), method="grid")
+            trials_per_hour = executor.trials_per_hour
+
+        best = max(results, key=lambda r: r["score"])
+        return {
+            "score": best["score"],
+            "params": best["params"],
+            "trials_per_hour": trials_per_hour,
+        }
 
-        best = {
-            "score": bayes_search_result.best_score_,
-            "params": bayes_search_result.best_params_,
+    def _warm_start(self, optimizer, names, store, executor):
+        # Prior trials on the same data and budget that lie inside this space
+        fixed = executor.resolve({})
+        for params, score in store.history(
+            executor.data_hash, fixed["epochs"], len(executor.folds)
+        ):
+            extra = {k: v for k, v in params.items() if k not in names}
+            point = [params.get(name) for name in names]
+            if extra == {k: v for k, v in fixed.items() if k not in names} and (
+                point in optimizer.space
+            ):
+                optimizer.tell(point, -score)
+
+    def _bayesian_search(self, X_train, y_train, param_space, n_iter=100):
+        from skopt import Optimizer
+
+        from alstm_stock_market.src.model.trials import TrialStore
+        from alstm_stock_market.src.model.tuning import TuningExecutor
+
+        names = list(param_space.keys())
+        optimizer = Optimizer(list(param_space.values()))
+
+        results = []
+        with TrialStore() as store, TuningExecutor(
+            X_train, y_train, store=store
+        ) as executor:
+            self._warm_start(optimizer, names, store, executor)
+
+            # One candidate per worker each round, proposed with a constant liar
+            while len(results) < n_iter:
+                points = optimizer.ask(
+                    n_points=min(executor.n_workers, n_iter - len(results))
+                )
+                batch = executor.evaluate(
+                    [dict(zip(names, x)) for x in points], method="bayes"
+                )
+                optimizer.tell(points, [-r["score"] for r in batch])
+                results.extend(batch)
+            trials_per_hour = executor.trials_per_hour
+
+        best = max(results, key=lambda r: r["score"])
+        return {
+            "score": best["score"],
+            "params": best["params"],
+            "trials_per_hour": trials_per_hour,
         }
 
-        save_txt(bayes_search_result, "BayesSearch_results")
-        return best
+    def _hyperband_search(self, X_train, y_train, param_space, resume=False):
+        from alstm_stock_market.src.model.trials import TrialStore
+        from alstm_stock_market.src.model.tuning import Hyperband, TuningExecutor
+
+        job_dir = os.path.join(os.environ["CACHE"], "hyperband")
+        with TrialStore() as store, TuningExecutor(
+            X_train, y_train, store=store
+        ) as executor:
+            hyperband = Hyperband(executor, param_space, job_dir, resume)
+            best, results = hyperband.run()
+            trials_per_hour = executor.trials_per_hour
+
+        return {
+            "score": best["score"],
+            "params": best["params"],
+            "trials_per_hour": trials_per_hour,
+            # A full Bayesian search of 100 candidates would train
+            # 100 * len(folds) * p.epochs epochs
+            "trained_epochs": sum(r["trained_epochs"] for r in results),
+        }
 
     def predict(self, X, name="y_pred"):
-        return self.model.predict(X, batch_size=p.batch_size).flatten()
+        return self.model.predict(X, batch_size=self.batch_size).flatten()
 
-    def incremental_train(self, X_train, y_train):
+    def incremental_train(self, X_train, y_train, train_range=None):
         if not self.load_weights:
             print("Model weights were not loaded. Loading latest weights.")
-            self.model.load_weights(get_latest_weights())
+            self._load_weights(get_latest_weights())
+        else:
+            # Cached models are shared read-only, other holders keep their weights
+            self.model = self.copy()
 
         self.model.fit(
-            X_train,
-            y_train,
+            **_fit_inputs(X_train, y_train, self.batch_size),
             epochs=p.incremental_epochs,
-            batch_size=p.batch_size,
             shuffle=False,
             verbose=1,
         )
 
-        save_weights(self.model)
+        self._save_weights(train_range)
@@ -11,15 +11,66 @@ wavelet_mode = "symmetric"
 levels = 3
 shrink_coeffs = [False, True, True, True]
 threshold_mode = "soft"
+wavelet_cache_size = 512 * 2**20  # Bytes
+causal_denoise = False  # Denoise each day only with past data, no look-ahead
+causal_window = 256
 
 # Model Params
 sets_sizes = {"train": 0.95, "valdn": 0.025, "test": 0.025}
 epochs = 2000
+patience = 100  # Epochs without validation improvement before stopping
 learning_rate = 0.00018
 hidden_state_size = 20
 batch_size = 128
 time_step = 20
 loss_function = "mean_squared_error"
 dropout_rate = 0.12241
+fused_attention = True
+jit_compile = False  # XLA, slower than the default runtime for the LSTM on CPU
+streaming_input = False  # Window lazily with tf.data instead of in memory arrays
 
 incremental_epochs = 15
+
+# Precision
+dtype = "float32"  # Arrays from the denoised data to the evaluator, or "float64"
+dtype_policy = "float32"  # Keras layers, "mixed_bfloat16" computes in bfloat16
+
+# Tuning
+tuning_workers = None  # All cores
+hyperband_eta = 3
+hyperband_min_epochs = 25  # Budget of the first rung of the largest bracket
+
+# Simulation
+simulation_paths = 10_000
+simulation_block_size = 20  # Days resampled together, keeps autocorrelation
+simulation_batch_memory = 256 * 2**20  # Bytes per worker
+simulation_workers = None  # All cores
+simulation_bins = 4000  # Quantiles within 0.5%
+
+# Batch
+batch_workers = None  # All cores
+global_batch_size = 1024  # Windows of many tickers per step in the shared model
+ticker_embedding_size = 4  # Zero trains the shared model without ticker identity
+batch_retries = 1  # Reruns of a ticker whose worker process died
+
+# Server
+server_host = "127.0.0.1"
+server_port = 8050
+server_max_batch = 64  # Windows per model call
+server_batch_wait = 0.002  # Seconds to wait for concurrent requests
+server_prices_ttl = 300  # Seconds before prices that include today are refreshed
+
+# Serving
+serving_format = None  # "saved_model" or "tflite", None predicts with the Keras model
+serving_quantization = None  # "int8" weights, TFLite only
+
+# Storage
+storage_backend = "cloudant"  # "sqlite" keeps the app's documents in LOGS, offline
+
+# Walk-forward
+walk_forward_block = 64  # Days predicted per model call between retrains
+drift_window = 20  # Days of errors compared by the drift policy
+drift_threshold = 1.5  # Growth of the recent error that triggers a retrain
+
+# Registry
+model_cache_size = 4  # Loaded models kept in memory, by weights version
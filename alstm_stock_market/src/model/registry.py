@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+from argparse import ArgumentParser
+from collections import OrderedDict
+from datetime import datetime
+
+import dotenv
+
+import alstm_stock_market.src.model.params as p
+
+dotenv.load_dotenv()
+
+# Parsed index files by path, reread only when their mtime changes
+_indexes = {}
+
+# Params that change the weights a training produces
+_model_params = [
+    "target",
+    "num_features",
+    "wavelet",
+    "levels",
+    "shrink_coeffs",
+    "causal_denoise",
+    "causal_window",
+    "learning_rate",
+    "hidden_state_size",
+    "time_step",
+    "dropout_rate",
+    "ticker_embedding_size",
+]
+
+
+def params_hash():
+    params = json.dumps({name: getattr(p, name) for name in _model_params})
+    return hashlib.sha1(params.encode()).hexdigest()[:12]
+
+
+class WeightsRegistry:
+    """Versions of the saved weights in index.json, so loads never scan the directory."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.environ["WEIGHTS"]
+        self.index_path = os.path.join(self.directory, "index.json")
+
+    def _read(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._migrate()
+
+        cached = _indexes.get(self.index_path)
+        if cached is None or cached[0] != mtime:
+            with open(self.index_path) as file:
+                cached = (mtime, json.load(file))
+            _indexes[self.index_path] = cached
+        return cached[1]
+
+    def _write(self, index):
+        # Written aside and renamed, readers never see a partial index
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(temp_path, self.index_path)
+        _indexes[self.index_path] = (os.stat(self.index_path).st_mtime_ns, index)
+
+    def _migrate(self):
+        # Weights saved before the registry, registered once in filename order
+        index = {"pinned": None, "versions": []}
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith("_weights.h5"):
+                    index["versions"].append(
+                        {"version": len(index["versions"]) + 1, "file": name}
+                    )
+            if index["versions"]:
+                self._write(index)
+        return index
+
+    def register(self, file, train_range=None, params_hash=None, metrics=None):
+        index = self._read()
+        versions = list(index["versions"])
+        if versions and versions[-1]["file"] == file:
+            # Saved again in the same session, or just registered by the migration
+            version = versions.pop()["version"]
+        else:
+            # Files are named by session, an older entry for file was overwritten
+            versions = [v for v in versions if v["file"] != file]
+            version = max((v["version"] for v in index["versions"]), default=0) + 1
+        versions.append(
+            {
+                "version": version,
+                "file": file,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "train_range": list(train_range) if train_range else None,
+                "params_hash": params_hash,
+                "metrics": metrics or {},
+            }
+        )
+        self._write({**index, "versions": versions})
+        return version
+
+    def versions(self):
+        return self._read()["versions"]
+
+    def get(self, version=None):
+        """Entry of version, by default the pinned one or else the newest."""
+        index = self._read()
+        if not index["versions"]:
+            raise FileNotFoundError(f"No weights registered in {self.directory}")
+
+        version = version or index["pinned"]
+        if version is None:
+            return index["versions"][-1]
+        for entry in index["versions"]:
+            if entry["version"] == version:
+                return entry
+        raise ValueError(f"Weights version {version} is not registered.")
+
+    def path(self, version=None):
+        return os.path.join(self.directory, self.get(version)["file"])
+
+    def annotate(self, version, **fields):
+        index = self._read()
+        versions = [
+            {**entry, **fields} if entry["version"] == version else entry
+            for entry in index["versions"]
+        ]
+        self._write({**index, "versions": versions})
+
+    def pin(self, version):
+        self.get(version)
+        self._write({**self._read(), "pinned": version})
+
+    def unpin(self):
+        self._write({**self._read(), "pinned": None})
+
+    def rollback(self):
+        """Pin the version before the current one."""
+        current = self.get()["version"]
+        previous = [v["version"] for v in self.versions() if v["version"] < current]
+        if not previous:
+            raise ValueError(f"No weights version before {current}.")
+        self.pin(previous[-1])
+        return previous[-1]
+
+
+class ModelCache:
+    """Loaded models by key, the least recently used evicted past capacity."""
+
+    def __init__(self, capacity=p.model_cache_size):
+        self.capacity = capacity
+        self.models = OrderedDict()
+
+    def get(self, key, load):
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key]
+
+        model = load()
+        self.put(key, model)
+        return model
+
+    def put(self, key, model):
+        self.models[key] = model
+        self.models.move_to_end(key)
+        while len(self.models) > self.capacity:
+            self.models.popitem(last=False)
+
+    def pop(self, key):
+        return self.models.pop(key, None)
+
+
+model_cache = ModelCache()
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List the registered weights versions.")
+    parser_pin = subparsers.add_parser("pin", help="Serve a fixed weights version.")
+    parser_pin.add_argument("version", type=int)
+    subparsers.add_parser("unpin", help="Serve the newest weights again.")
+    subparsers.add_parser("rollback", help="Pin the version before the current one.")
+    args = parser.parse_args()
+
+    registry = WeightsRegistry()
+    if args.command == "pin":
+        registry.pin(args.version)
+    elif args.command == "unpin":
+        registry.unpin()
+    elif args.command == "rollback":
+        registry.rollback()
+
+    if not registry.versions():
+        print("Nenhuma versão de pesos registrada em", registry.directory)
+        return
+
+    current = registry.get()["version"]
+    for entry in registry.versions():
+        marker = "*" if entry["version"] == current else " "
+        print(
+            f"{marker} v{entry['version']}: {entry['file']},",
+            f"treino {entry.get('train_range') or '-'},",
+            f"métricas {entry.get('metrics') or '-'}",
+        )
+
+
+if __name__ == "__main__":
+    main()
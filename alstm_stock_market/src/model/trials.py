@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+from alstm_stock_market.src.helpers.cache import fingerprint
+
+
+def _plain(params):
+    return {k: v.item() if isinstance(v, np.generic) else v for k, v in params.items()}
+
+
+def params_hash(params):
+    return fingerprint(json.dumps(_plain(params), sort_keys=True))
+
+
+class TrialStore:
+    """SQLite database of tuning trials, one row per candidate and fold."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.environ["LOGS"], "trials.sqlite")
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trials (
+                id INTEGER PRIMARY KEY,
+                method TEXT NOT NULL,
+                data_hash TEXT NOT NULL,
+                params_hash TEXT NOT NULL,
+                params TEXT NOT NULL,
+                epochs INTEGER NOT NULL,
+                initial_epoch INTEGER NOT NULL,
+                fold INTEGER NOT NULL,
+                score REAL NOT NULL,
+                fit_time REAL NOT NULL,
+                peak_memory INTEGER NOT NULL,
+                created TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS trials_lookup "
+            "ON trials (data_hash, params_hash, initial_epoch)"
+        )
+
+    def add(self, method, data_hash, params, epochs, folds, initial_epoch=0):
+        # folds holds one (score, fit_time, peak_memory) tuple per fold
+        created = datetime.now().isoformat(timespec="seconds")
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO trials (method, data_hash, params_hash, params, epochs,"
+                " initial_epoch, fold, score, fit_time, peak_memory, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        method,
+                        data_hash,
+                        params_hash(params),
+                        json.dumps(_plain(params), sort_keys=True),
+                        epochs,
+                        initial_epoch,
+                        fold,
+                        float(score),
+                        float(fit_time),
+                        int(peak_memory),
+                        created,
+                    )
+                    for fold, (score, fit_time, peak_memory) in enumerate(folds)
+                ],
+            )
+
+    def lookup(self, data_hash, params, n_folds):
+        """Fold results of a previous full training of params, if all folds ran."""
+        rows = self.connection.execute(
+            "SELECT fold, score, fit_time, peak_memory FROM trials"
+            " WHERE data_hash = ? AND params_hash = ? AND initial_epoch = 0"
+            " ORDER BY id",
+            (data_hash, params_hash(params)),
+        ).fetchall()
+
+        folds = {
+            fold: (score, fit_time, memory) for fold, score, fit_time, memory in rows
+        }
+        if len(folds) < n_folds:
+            return None
+        return [folds[k] for k in range(n_folds)]
+
+    def history(self, data_hash, epochs, n_folds):
+        """Mean score of every fully cross-validated candidate trained for epochs."""
+        rows = self.connection.execute(
+            "SELECT params, AVG(score) FROM trials"
+            " WHERE data_hash = ? AND epochs = ? AND initial_epoch = 0"
+            " GROUP BY params_hash HAVING COUNT(DISTINCT fold) = ?",
+            (data_hash, epochs, n_folds),
+        ).fetchall()
+        return [(json.loads(params), score) for params, score in rows]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
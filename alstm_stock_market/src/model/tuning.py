@@ -0,0 +1,289 @@
+import json
+import os
+import resource
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+from sklearn.model_selection import TimeSeriesSplit
+from skopt.space import Space
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.cache import fingerprint
+from alstm_stock_market.src.helpers.utils import set_tensorflow_threads
+
+_worker = {}
+
+
+def _init_worker(X_path, y_path, threads):
+    set_tensorflow_threads(threads)
+
+    # Memory mapped, every worker shares the same pages instead of a pickled copy
+    _worker["X"] = np.load(X_path, mmap_mode="r")
+    _worker["y"] = np.load(y_path, mmap_mode="r")
+
+
+def _split_params(params):
+    model_params = {
+        k.removeprefix("model__"): v
+        for k, v in params.items()
+        if k.startswith("model__")
+    }
+    fit_params = {k: v for k, v in params.items() if not k.startswith("model__")}
+    fit_params.setdefault("batch_size", p.batch_size)
+    fit_params.setdefault("epochs", p.epochs)
+    return model_params, fit_params
+
+
+def _run_trial(params, train, test, load_path=None, save_path=None, initial_epoch=0):
+    import tensorflow as tf
+
+    from alstm_stock_market.src.model.model import create_model
+
+    X, y = _worker["X"], _worker["y"]
+    model_params, fit_params = _split_params(params)
+
+    start = perf_counter()
+    model = create_model(**model_params)
+    if load_path:
+        model.load_weights(load_path)
+    model.fit(
+        X[train[0] : train[1]],
+        y[train[0] : train[1]],
+        initial_epoch=initial_epoch,
+        shuffle=False,
+        verbose=0,
+        **fit_params,
+    )
+    if save_path:
+        model.save_weights(save_path)
+    fit_time = perf_counter() - start
+
+    # Same sign convention as sklearn's neg_mean_squared_error scoring
+    score = -model.evaluate(X[test[0] : test[1]], y[test[0] : test[1]], verbose=0)
+    tf.keras.backend.clear_session()
+
+    # Peak resident set of the worker so far, in kilobytes on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return score, fit_time, peak_memory
+
+
+class TuningExecutor:
+    """Process pool running cross-validated trials, one TensorFlow runtime per core."""
+
+    def __init__(self, X_train, y_train, n_workers=None, n_splits=3, store=None):
+        self.store = store
+        self.data_hash = fingerprint(X_train, y_train, n_splits)
+        self.n_workers = n_workers or p.tuning_workers or os.cpu_count()
+        threads = max(1, os.cpu_count() // self.n_workers)
+
+        self.tmp_dir = TemporaryDirectory(dir=os.environ["CACHE"])
+        X_path = os.path.join(self.tmp_dir.name, "X_train.npy")
+        y_path = os.path.join(self.tmp_dir.name, "y_train.npy")
+        np.save(X_path, X_train)
+        np.save(y_path, y_train)
+
+        # Folds are contiguous in time, so (start, stop) pairs are enough
+        self.folds = [
+            ((train[0], train[-1] + 1), (test[0], test[-1] + 1))
+            for train, test in TimeSeriesSplit(n_splits=n_splits).split(X_train)
+        ]
+
+        self.pool = ProcessPoolExecutor(
+            self.n_workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(X_path, y_path, threads),
+        )
+        self.trials = 0
+        self.start = perf_counter()
+
+    def _submit(self, params, load_prefix, save_prefix, initial_epoch):
+        return [
+            self.pool.submit(
+                _run_trial,
+                params,
+                train,
+                test,
+                load_prefix and f"{load_prefix}_fold{k}.h5",
+                save_prefix and f"{save_prefix}_fold{k}.h5",
+                initial_epoch,
+            )
+            for k, (train, test) in enumerate(self.folds)
+        ]
+
+    def _lookup(self, params, checkpoint):
+        # Checkpointed trials must run to write their weights
+        if self.store is None or any(checkpoint):
+            return None
+        return self.store.lookup(self.data_hash, self.resolve(params), len(self.folds))
+
+    def evaluate(self, candidates, checkpoints=None, initial_epoch=0, method=None):
+        # checkpoints holds a (load_prefix, save_prefix) pair per candidate,
+        # continuing training from initial_epoch instead of from scratch
+        checkpoints = checkpoints or [(None, None)] * len(candidates)
+        cached = [self._lookup(*args) for args in zip(candidates, checkpoints)]
+        futures = [
+            None if folds else self._submit(params, *checkpoint, initial_epoch)
+            for params, checkpoint, folds in zip(candidates, checkpoints, cached)
+        ]
+
+        results = []
+        for params, folds, trial in zip(candidates, cached, futures):
+            if trial is not None:
+                folds = [f.result() for f in trial]
+                if self.store:
+                    resolved = self.resolve(params)
+                    self.store.add(
+                        method,
+                        self.data_hash,
+                        resolved,
+                        resolved["epochs"],
+                        folds,
+                        initial_epoch,
+                    )
+                self.trials += 1
+
+            scores, fit_times, peak_memory = zip(*folds)
+            results.append(
+                {
+                    "params": params,
+                    "scores": list(scores),
+                    "score": float(np.mean(scores)),
+                    "fit_time": float(np.sum(fit_times)),
+                    "peak_memory": int(np.max(peak_memory)),
+                    "cached": trial is None,
+                }
+            )
+        return results
+
+    @staticmethod
+    def resolve(params):
+        """Candidate params with the defaulted batch size and epochs filled in."""
+        _, fit_params = _split_params(params)
+        return {**params, **fit_params}
+
+    @property
+    def trials_per_hour(self):
+        return 3600 * self.trials / (perf_counter() - self.start)
+
+    def close(self):
+        self.pool.shutdown()
+        self.tmp_dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Hyperband:
+    """Hyperband brackets of successive halving, resumable from its results file."""
+
+    def __init__(self, executor, param_space, job_dir, resume=False, seed=0):
+        self.executor = executor
+        self.names = list(param_space.keys())
+        self.space = Space(list(param_space.values()))
+        self.seed = seed
+        self.job_dir = job_dir
+        self.results_path = os.path.join(job_dir, "results.jsonl")
+
+        if not resume:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir, exist_ok=True)
+        self.records = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.results_path):
+            return {}
+        with open(self.results_path) as file:
+            records = [json.loads(line) for line in file]
+        return {(r["bracket"], r["rung"], r["config"]): r for r in records}
+
+    def _save(self, record):
+        self.records[(record["bracket"], record["rung"], record["config"])] = record
+        with open(self.results_path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def _sample(self, bracket, n):
+        # Seeded per bracket, so a resumed job draws the same configurations
+        points = self.space.rvs(n, random_state=self.seed + bracket)
+        return [
+            {
+                k: v.item() if isinstance(v, np.generic) else v
+                for k, v in zip(self.names, x)
+            }
+            for x in points
+        ]
+
+    def _checkpoint(self, bracket, rung, config):
+        if rung < 0:
+            return None
+        return os.path.join(self.job_dir, f"b{bracket}_r{rung}_c{config}")
+
+    def run(self, max_epochs=None, min_epochs=None, eta=None):
+        max_epochs = max_epochs or p.epochs
+        min_epochs = min_epochs or p.hyperband_min_epochs
+        eta = eta or p.hyperband_eta
+        s_max = int(np.log(max_epochs / min_epochs) / np.log(eta) + 1e-9)
+
+        for bracket in range(s_max, -1, -1):
+            n = int(np.ceil((s_max + 1) / (bracket + 1) * eta**bracket))
+            configs = list(enumerate(self._sample(bracket, n)))
+            previous_epochs = 0
+
+            for rung in range(bracket + 1):
+                # Budgets step geometrically from min_epochs, on the first rung
+                # of the largest bracket, to max_epochs on every last rung
+                step = (rung + s_max - bracket) / s_max if s_max else 1
+                epochs = int(round(min_epochs * (max_epochs / min_epochs) ** step))
+                pending = [
+                    (c, params)
+                    for c, params in configs
+                    if (bracket, rung, c) not in self.records
+                ]
+                results = self.executor.evaluate(
+                    [{**params, "epochs": epochs} for _, params in pending],
+                    [
+                        (
+                            self._checkpoint(bracket, rung - 1, c),
+                            self._checkpoint(bracket, rung, c),
+                        )
+                        for c, _ in pending
+                    ],
+                    initial_epoch=previous_epochs,
+                    method="hyperband",
+                )
+                for (c, params), result in zip(pending, results):
+                    self._save(
+                        {
+                            **result,
+                            "params": params,
+                            "bracket": bracket,
+                            "rung": rung,
+                            "config": c,
+                            "epochs": epochs,
+                            "trained_epochs": (epochs - previous_epochs)
+                            * len(self.executor.folds),
+                        }
+                    )
+
+                # Only the best 1/eta configurations are promoted to the next rung
+                configs = sorted(
+                    configs,
+                    key=lambda config: self.records[(bracket, rung, config[0])][
+                        "score"
+                    ],
+                    reverse=True,
+                )[: max(1, len(configs) // eta)]
+                previous_epochs = epochs
+
+        results = list(self.records.values())
+        best = max(
+            (r for r in results if r["epochs"] == max_epochs), key=lambda r: r["score"]
+        )
+        return best, results
@@ -0,0 +1,256 @@
+from argparse import ArgumentParser
+from datetime import date
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from tensorflow.keras.optimizers import Adam
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.data.wavelet import causal_wavelet_denoise, wavelet_denoise
+from alstm_stock_market.src.helpers.stats import RunningMoments
+from alstm_stock_market.src.helpers.utils import save_columns
+from alstm_stock_market.src.model.evaluator import Evaluator
+
+
+class Never:
+    def __init__(self):
+        self.name = "Sem retreino"
+
+    def should_retrain(self, days, errors):
+        return False
+
+
+class EveryKDays:
+    """Retrain once k days have closed since the last training, as App does."""
+
+    def __init__(self, k=p.batch_size):
+        self.name = f"A cada {k} dias"
+        self.k = k
+
+    def should_retrain(self, days, errors):
+        return days >= self.k
+
+
+class OnDrift:
+    """Retrain when recent errors outgrow those right after the last training."""
+
+    def __init__(self, window=p.drift_window, threshold=p.drift_threshold):
+        self.name = f"Drift ({threshold:g}x em {window} dias)"
+        self.window = window
+        self.threshold = threshold
+
+    def should_retrain(self, days, errors):
+        if len(errors) < 2 * self.window:
+            return False
+        reference = np.mean(errors[: self.window])
+        return np.mean(errors[-self.window :]) > self.threshold * reference
+
+
+def default_policies():
+    return [Never(), EveryKDays(), EveryKDays(p.drift_window), OnDrift()]
+
+
+class WalkForward:
+    """Predict history day by day from start, retraining when a policy says so."""
+
+    def __init__(
+        self,
+        data,
+        start,
+        model,
+        normalizer=None,
+        epochs=p.incremental_epochs,
+        block_size=p.walk_forward_block,
+    ):
+        data = data.dropna()
+        self.values = data.to_numpy(dtype=np.float64)
+        self.dates = data.index
+        self.target = list(data.columns).index(p.target)
+        # Causal rows only see their past, so the whole series is denoised once
+        self.transformed = (
+            causal_wavelet_denoise(self.values) if p.causal_denoise else None
+        )
+
+        # Row of the first predicted day, every row before it is training data
+        self.start = self.dates.searchsorted(pd.Timestamp(start))
+        if not p.time_step <= self.start < len(self.dates):
+            raise ValueError(f"Start {start} leaves no history or no days to predict.")
+
+        self.model = model
+        self.epochs = epochs
+        self.block_size = block_size
+
+        # Every policy starts from these weights and moments
+        self.weights = model.get_weights()
+        normalizer = normalizer or Normalizer(self.target).update(
+            self._denoise(np.arange(self.start))
+        )
+        self.moments = (
+            normalizer.moments.count,
+            normalizer.moments.mean.copy(),
+            normalizer.moments.m2.copy(),
+        )
+
+    def _denoise(self, rows):
+        # A block of consecutive rows denoised on its own, as App's Preprocessor
+        # denoises the days it trains on
+        if self.transformed is not None:
+            return self.transformed[rows]
+        return wavelet_denoise(self.values[rows])
+
+    def _inputs(self, rows, normalizer):
+        # The p.time_step rows before each row, each window denoised on its own
+        # as App does, so no window sees the day it predicts or any later one
+        if self.transformed is not None:
+            windows = sliding_window_view(self.transformed, p.time_step, axis=0)
+            windows = windows.transpose(0, 2, 1)[rows - p.time_step]
+        else:
+            windows = sliding_window_view(self.values, p.time_step, axis=0)
+            windows = wavelet_denoise(
+                windows.transpose(0, 2, 1)[rows - p.time_step], axis=1
+            )
+        return normalizer.transform(windows.astype(p.dtype))
+
+    def _retrain(self, rows, normalizer):
+        # Warm weights, only the windows of days closed since the last training
+        block = self._denoise(np.arange(rows[0] - p.time_step, rows[-1] + 1))
+        # As App, the new days join the statistics before they are trained on
+        normalizer.update(block[p.time_step :])
+        values = normalizer.transform(block.astype(p.dtype))
+        X = sliding_window_view(values, p.time_step, axis=0).transpose(0, 2, 1)[:-1]
+        self.model.fit(
+            X,
+            values[p.time_step :, self.target],
+            batch_size=p.batch_size,
+            epochs=self.epochs,
+            shuffle=False,
+            verbose=0,
+        )
+        return len(rows)
+
+    def run(self, policy):
+        self.model.set_weights(self.weights)
+        # A fresh optimizer state, compiling keeps the built weights
+        self.model.compile(
+            optimizer=Adam(learning_rate=p.learning_rate),
+            loss=p.loss_function,
+            jit_compile=p.jit_compile,
+        )
+        normalizer = Normalizer(self.target, RunningMoments(*self.moments))
+
+        n = len(self.values)
+        y_pred = np.empty(n - self.start)
+        errors = []
+        stats = {
+            "retrains": 0,
+            "train_windows": 0,
+            "fit_time": 0.0,
+            "predict_time": 0.0,
+        }
+
+        last_train = row = self.start
+        while row < n:
+            # Days until the next retrain share one batched call, the rest of
+            # a block is discarded once a retrain changes the weights
+            rows = np.arange(row, min(row + self.block_size, n))
+            X = self._inputs(rows, normalizer)
+            start = perf_counter()
+            block = self.model.predict_on_batch(X).flatten()
+            stats["predict_time"] += perf_counter() - start
+            block = normalizer.inverse_transform_target(block)
+
+            for row, pred in zip(rows, block):
+                y_pred[row - self.start] = pred
+                # Errors against the real close, the price App's predictions target
+                errors.append(abs(pred - self.values[row, self.target]))
+
+                # Day row has closed, its target is known from here on
+                if policy.should_retrain(row + 1 - last_train, errors):
+                    start = perf_counter()
+                    stats["train_windows"] += self._retrain(
+                        np.arange(last_train, row + 1), normalizer
+                    )
+                    stats["fit_time"] += perf_counter() - start
+                    stats["retrains"] += 1
+                    last_train, errors = row + 1, []
+                    break
+            row += 1
+
+        evaluator = Evaluator(self.values[self.start :, self.target], y_pred)
+        evaluator.run()
+        return {
+            **evaluator.metrics,
+            "hit_rate": np.mean(evaluator.y_trend == evaluator.y_pred_trend),
+            **stats,
+        }
+
+    def run_all(self, policies):
+        return {policy.name: self.run(policy) for policy in policies}
+
+
+def main():
+    from alstm_stock_market.src.data.market_data import MarketData
+    from alstm_stock_market.src.helpers.utils import get_latest_normalizer
+    from alstm_stock_market.src.model.model import Model
+    from alstm_stock_market.src.model.registry import WeightsRegistry
+
+    parser = ArgumentParser()
+    parser.add_argument("start", help="First day to predict, as YYYY-MM-DD.")
+    parser.add_argument(
+        "-e",
+        "--end",
+        default=date.today().strftime("%Y-%m-%d"),
+        help="Last day of history, by default today.",
+    )
+    args = parser.parse_args()
+
+    # Days the weights were trained on would be predicted in-sample
+    weights = WeightsRegistry().get()
+    if not weights.get("train_range"):
+        raise ValueError(
+            f"Weights version {weights['version']} has no recorded training range."
+        )
+    if pd.Timestamp(args.start) <= pd.Timestamp(weights["train_range"][1]):
+        raise ValueError(
+            f"Start {args.start} is not after the training end of weights version "
+            f"{weights['version']}, {weights['train_range'][1]}."
+        )
+
+    data = MarketData().download(p.ticker, p.start, args.end)
+    normalizer_path = get_latest_normalizer()
+
+    walk_forward = WalkForward(
+        data,
+        args.start,
+        # Policies retrain it, the cached model is left untouched
+        Model(load_weights=True).copy(),
+        Normalizer.load(normalizer_path) if normalizer_path else None,
+    )
+    results = walk_forward.run_all(default_policies())
+
+    names = list(results)
+    path = save_columns(
+        {
+            "policies": names,
+            **{
+                key: np.array([results[name][key] for name in names])
+                for key in results[names[0]]
+            },
+        },
+        "walk_forward",
+    )
+
+    print(f"\nWalk-forward de {args.start} a {args.end}:")
+    for name, result in results.items():
+        print(
+            f"{name}: RMSE {result['rmse']:.4f}, acerto de tendência {result['hit_rate']:.2%},",
+            f"{result['retrains']} retreinos, {result['fit_time']:.1f} s de treino",
+        )
+    print(f"Resultados salvos em {path}")
+
+
+if __name__ == "__main__":
+    main()
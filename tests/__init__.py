@@ -0,0 +1,27 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+CALENDAR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "alstm_stock_market",
+    "src",
+    "helpers",
+    "calendars",
+    "us.cal",
+)
+
+
+def temp_dirs(test, *names):
+    """Point each environment variable in names at its own temporary directory."""
+    tmp = TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+
+    paths = {name: os.path.join(tmp.name, name.lower()) for name in names}
+    for path in paths.values():
+        os.makedirs(path)
+
+    environ = mock.patch.dict(os.environ, paths)
+    environ.start()
+    test.addCleanup(environ.stop)
+    return paths
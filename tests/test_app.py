@@ -0,0 +1,70 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.bench import synthetic_data
+from alstm_stock_market.src.app.app import App, Backfill
+from alstm_stock_market.src.app.storage import SQLiteStorage
+from alstm_stock_market.src.data.market_data import LocalFetcher, MarketData
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.helpers.utils import save_normalizer, save_weights
+from alstm_stock_market.src.model.model import create_model
+from alstm_stock_market.src.model.registry import model_cache
+from tests import CALENDAR, temp_dirs
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.dirs = temp_dirs(self, "WEIGHTS", "LOGS", "CACHE")
+        self.data = synthetic_data(1500)
+        self.data.index = pd.bdate_range("2016-01-04", periods=len(self.data))
+        environ = mock.patch.dict(
+            os.environ,
+            {
+                "CALENDAR": CALENDAR,
+                "MAX_TRAINING_DATE": self.data.index[-1].strftime("%Y-%m-%d"),
+            },
+        )
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        model_cache.models.clear()
+        save_weights(create_model())
+        self.market_data = MarketData(
+            LocalFetcher({p.ticker: self.data}), self.dirs["CACHE"]
+        )
+
+    def assert_matches_app(self):
+        end = self.data.index[-1].strftime("%Y-%m-%d")
+        start = self.data.index[-8].strftime("%Y-%m-%d")
+        path = os.path.join(self.dirs["LOGS"], "storage.sqlite")
+        backfill = Backfill(start, end, SQLiteStorage(path), self.market_data)
+        backfill.run()
+        with SQLiteStorage(path) as storage:
+            docs = storage.fetch(start, end)
+
+        self.assertEqual(backfill.written, len(backfill.pred_dates))
+        np.testing.assert_allclose(
+            [doc["pred_close"] for doc in docs.values()], backfill.pred_closes
+        )
+
+        for date, pred_close in zip(backfill.pred_dates, backfill.pred_closes):
+            app = App(date.strftime("%Y-%m-%d"), market_data=self.market_data)
+            app._make_prediction()
+            self.assertAlmostEqual(float(app.pred_close), pred_close, places=2)
+
+    def test_window_statistics(self):
+        self.assert_matches_app()
+
+    def test_causal_with_normalizer(self):
+        save_normalizer(
+            Normalizer(list(self.data.columns).index(p.target)).update(
+                self.data.to_numpy(dtype=np.float64)
+            )
+        )
+        with mock.patch.object(p, "causal_denoise", True):
+            self.assert_matches_app()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+import alstm_stock_market.src.manager.strategies as st
+from alstm_stock_market.src.manager.backtest import backtest
+from alstm_stock_market.src.manager.manager import Manager
+from tests import temp_dirs
+
+
+def strategies():
+    return {
+        **st.default_strategies(1000, 100),
+        **st.proportional_grid(1000),
+    }
+
+
+class BacktestTest(unittest.TestCase):
+    def setUp(self):
+        temp_dirs(self, "LOGS")
+
+    def test_matches_manager_loop(self):
+        rng = np.random.default_rng(0)
+        for scale in [0.01, 0.2]:  # The larger returns ruin most strategies
+            returns = rng.normal(0, scale, 250)
+            preds = rng.random(250) < 0.55
+            all_results = Manager(1000, 100, preds, returns).run_all(strategies())
+
+            # Each strategy in its own loop, from its own initial bet
+            for name, strategy in strategies().items():
+                manager = Manager(1000, strategy.initial_bet, preds, returns)
+                expected = manager.run(strategy)
+                for column, values in expected.items():
+                    np.testing.assert_array_equal(
+                        all_results[name][column], values, f"{name} {column}"
+                    )
+
+    def test_ruin(self):
+        returns = np.array([1.0, -0.5, 0.5, 0.1])
+        results = backtest([st.Fixed(1000)], [False] * 4, returns, 1000)
+
+        self.assertTrue(results["ruined"][0])
+        self.assertEqual(results["rounds"][0], 1)
+        np.testing.assert_array_equal(
+            results["bankroll"][:, 0], [1000, 0] + [np.nan] * 3
+        )
+
+    def test_paths_match_single_runs(self):
+        rng = np.random.default_rng(1)
+        returns = rng.normal(0, 0.05, (4, 100))
+        preds = rng.random((4, 100)) < 0.55
+
+        paths = backtest(list(strategies().values()), preds, returns, 1000)
+        for i in range(len(returns)):
+            single = backtest(list(strategies().values()), preds[i], returns[i], 1000)
+            for column, values in single.items():
+                np.testing.assert_array_equal(paths[column][..., i, :], values)
+
+    def test_no_rounds(self):
+        manager = Manager(1000, 100, np.array([], dtype=bool), np.array([]))
+        results = manager.run_all({"Apostas Fixas": st.Fixed(100)})
+
+        np.testing.assert_array_equal(results["Apostas Fixas"]["bankroll"], [1000])
+        np.testing.assert_array_equal(results["Apostas Fixas"]["bets"], [100])
+        self.assertEqual(len(results["Apostas Fixas"]["gains_losses"]), 0)
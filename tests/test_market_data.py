@@ -0,0 +1,44 @@
+import unittest
+
+import pandas as pd
+
+from alstm_stock_market.bench import synthetic_data
+from alstm_stock_market.src.data.market_data import LocalFetcher, MarketData
+from tests import temp_dirs
+
+
+class MarketDataTest(unittest.TestCase):
+    def setUp(self):
+        self.data = synthetic_data(500)
+        self.data.index = pd.bdate_range("2020-01-01", periods=len(self.data))
+        self.fetcher = LocalFetcher({"^GSPC": self.data})
+        self.market_data = MarketData(self.fetcher, temp_dirs(self, "CACHE")["CACHE"])
+
+    def test_cached_matches_download(self):
+        cold = self.market_data.download("^GSPC", "2020-02-03", "2020-06-01")
+        warm = self.market_data.download("^GSPC", "2020-02-03", "2020-06-01")
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+        # Parquet doesn't keep the index frequency, only the days and prices
+        expected = self.fetcher("^GSPC", "2020-02-03", "2020-06-01")
+        pd.testing.assert_frame_equal(cold, expected, check_freq=False)
+        pd.testing.assert_frame_equal(warm, expected, check_freq=False)
+
+    def test_only_missing_days_fetched(self):
+        self.market_data.download("^GSPC", "2020-02-03", "2020-06-01")
+        data = self.market_data.download("^GSPC", "2020-01-06", "2020-07-01")
+
+        self.assertEqual(
+            self.fetcher.calls[1:],
+            [
+                ("^GSPC", "2020-01-06", "2020-02-03"),
+                ("^GSPC", "2020-06-01", "2020-07-01"),
+            ],
+        )
+        pd.testing.assert_frame_equal(
+            data,
+            self.data[
+                ("2020-01-06" <= self.data.index) & (self.data.index < "2020-07-01")
+            ],
+            check_freq=False,
+        )
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.src.helpers.utils import save_weights
+from alstm_stock_market.src.model.model import (
+    ClassicAttention,
+    FusedClassicAttention,
+    FusedTanhAttention,
+    Model,
+    TanhAttention,
+    create_model,
+)
+from alstm_stock_market.src.model.registry import model_cache
+from tests import temp_dirs
+
+
+class FusedAttentionTest(unittest.TestCase):
+    def setUp(self):
+        self.x = tf.random.normal((8, p.time_step, p.hidden_state_size), seed=0)
+
+    def test_classic(self):
+        legacy, fused = ClassicAttention(), FusedClassicAttention()
+        expected = legacy(self.x)
+        fused(self.x)
+        fused.set_weights(FusedClassicAttention.fuse_weights(*legacy.get_weights()))
+        np.testing.assert_allclose(fused(self.x), expected, atol=1e-5)
+
+    def test_tanh(self):
+        legacy, fused = TanhAttention(), FusedTanhAttention()
+        expected = legacy(self.x)
+        fused(self.x)
+        fused.set_weights(legacy.get_weights())
+        np.testing.assert_allclose(fused(self.x), expected, atol=1e-5)
+
+
+class ModelCacheTest(unittest.TestCase):
+    def setUp(self):
+        temp_dirs(self, "WEIGHTS")
+        model_cache.models.clear()
+        save_weights(create_model())
+
+    def test_loads_share_a_model(self):
+        self.assertIs(Model(load_weights=True).model, Model(load_weights=True).model)
+
+    def test_incremental_train_leaves_cached_model(self):
+        loaded = Model(load_weights=True)
+        weights = loaded.model.get_weights()
+
+        rng = np.random.default_rng(0)
+        X = rng.random((16, p.time_step, p.num_features), dtype=np.float32)
+        y = rng.random(16, dtype=np.float32)
+        trained = Model(load_weights=True)
+        with mock.patch.object(p, "incremental_epochs", 1):
+            trained.incremental_train(X, y)
+
+        for before, after in zip(weights, loaded.model.get_weights()):
+            np.testing.assert_array_equal(before, after)
+        self.assertIsNot(trained.model, loaded.model)
+        self.assertIs(Model(load_weights=True).model, trained.model)
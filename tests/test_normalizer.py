@@ -0,0 +1,52 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from alstm_stock_market.bench import synthetic_data
+from alstm_stock_market.src.data.normalizer import Normalizer
+from alstm_stock_market.src.helpers.stats import RunningMoments
+
+
+class RunningMomentsTest(unittest.TestCase):
+    def test_batches_match_whole_series(self):
+        values = synthetic_data(1000).to_numpy(dtype=np.float64)
+        moments = RunningMoments()
+        for batch in np.array_split(values, [1, 10, 10, 500]):
+            moments.update(batch)
+
+        self.assertEqual(moments.count, len(values))
+        np.testing.assert_allclose(moments.mean, values.mean(axis=0))
+        np.testing.assert_allclose(moments.std, values.std(axis=0, ddof=1))
+
+
+class NormalizerTest(unittest.TestCase):
+    def setUp(self):
+        self.values = synthetic_data(500).to_numpy(dtype=np.float64)
+        self.normalizer = Normalizer(3).update(self.values[:300])
+
+    def test_save_and_load(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "normalizer.json")
+            self.normalizer.save(path)
+            loaded = Normalizer.load(path)
+
+        self.assertEqual(loaded.target_col_idx, 3)
+        np.testing.assert_array_equal(loaded.mean, self.normalizer.mean)
+        np.testing.assert_array_equal(loaded.std, self.normalizer.std)
+
+        # A loaded normalizer keeps accumulating where the saved one stopped
+        loaded.update(self.values[300:])
+        np.testing.assert_allclose(loaded.mean, self.values.mean(axis=0))
+
+    def test_inverse_transform_target(self):
+        normalized = self.normalizer.transform(self.values)
+        np.testing.assert_allclose(
+            self.normalizer.inverse_transform_target(normalized[:, 3]),
+            self.values[:, 3],
+        )
+
+    def test_transform_keeps_float32(self):
+        values = self.values.astype(np.float32)
+        self.assertEqual(self.normalizer.transform(values).dtype, np.float32)
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.bench import synthetic_data
+from alstm_stock_market.src.data.preprocessor import Preprocessor
+
+
+def loop_sequentialize(data_normalized, target_col_idx):
+    # Windowing as it was done before the strided view
+    X_seq, y_seq = [], []
+    for i in range(len(data_normalized) - p.time_step):
+        X_seq.append(data_normalized.iloc[i : i + p.time_step, :])
+        y_seq.append(data_normalized.iloc[i + p.time_step, target_col_idx])
+    return np.array(X_seq), np.array(y_seq)
+
+
+class SequentializeTest(unittest.TestCase):
+    def test_windows_match_loop(self):
+        for rows in [p.time_step + 1, 2 * p.time_step + 1, 401]:
+            pre = Preprocessor(synthetic_data(rows), p.sets_sizes, cache=False)
+            pre.data_normalized = (pre.data - pre.data.mean()) / pre.data.std()
+            pre._sequentialize()
+
+            X, y = loop_sequentialize(pre.data_normalized, pre.target_col_idx)
+            np.testing.assert_array_equal(pre.X, X.astype(p.dtype))
+            np.testing.assert_array_equal(pre.y, y.astype(p.dtype))
+
+    def test_windows_are_read_only_views(self):
+        pre = Preprocessor(synthetic_data(401), p.sets_sizes, cache=False)
+        pre.run()
+
+        self.assertFalse(pre.X.flags.writeable)
+        self.assertTrue(np.shares_memory(pre.X, pre.values))
+        with self.assertRaises(ValueError):
+            pre.X_train[0, 0, 0] = 0
+
+    def test_splits_cover_every_window(self):
+        pre = Preprocessor(synthetic_data(1001), p.sets_sizes, cache=False)
+        pre.run()
+
+        X = np.concatenate([pre.X_train, pre.X_valdn, pre.X_test])
+        y = np.concatenate([pre.y_train, pre.y_valdn, pre.y_test])
+        np.testing.assert_array_equal(X, pre.X)
+        np.testing.assert_array_equal(y, pre.y)
+        self.assertEqual(len(pre.dates_test), len(pre.y_test))
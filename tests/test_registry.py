@@ -0,0 +1,117 @@
+import os
+import unittest
+
+from alstm_stock_market.src.helpers.utils import get_latest_normalizer
+from alstm_stock_market.src.model.registry import ModelCache, WeightsRegistry
+from tests import temp_dirs
+
+
+def touch(directory, name):
+    open(os.path.join(directory, name), "w").close()
+
+
+class WeightsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = temp_dirs(self, "WEIGHTS")["WEIGHTS"]
+        self.registry = WeightsRegistry()
+        for session in ["2023-01-01", "2023-02-01", "2023-03-01"]:
+            touch(self.directory, f"{session}_weights.h5")
+            self.registry.register(f"{session}_weights.h5")
+
+    def test_newest_by_default(self):
+        self.assertEqual([v["version"] for v in self.registry.versions()], [1, 2, 3])
+        self.assertEqual(self.registry.get()["file"], "2023-03-01_weights.h5")
+        self.assertEqual(
+            self.registry.path(),
+            os.path.join(self.directory, "2023-03-01_weights.h5"),
+        )
+
+    def test_pin_and_unpin(self):
+        self.registry.pin(1)
+        self.assertEqual(self.registry.get()["version"], 1)
+
+        # A newer training doesn't replace the pinned version
+        touch(self.directory, "2023-04-01_weights.h5")
+        self.assertEqual(self.registry.register("2023-04-01_weights.h5"), 4)
+        self.assertEqual(self.registry.get()["version"], 1)
+
+        self.registry.unpin()
+        self.assertEqual(self.registry.get()["version"], 4)
+
+        with self.assertRaises(ValueError):
+            self.registry.pin(5)
+
+    def test_rollback(self):
+        self.assertEqual(self.registry.rollback(), 2)
+        self.assertEqual(self.registry.rollback(), 1)
+        self.assertEqual(self.registry.get()["file"], "2023-01-01_weights.h5")
+        with self.assertRaises(ValueError):
+            self.registry.rollback()
+
+    def test_index_shared_between_instances(self):
+        WeightsRegistry(self.directory).pin(2)
+        self.assertEqual(self.registry.get()["version"], 2)
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = temp_dirs(self, "WEIGHTS")["WEIGHTS"]
+
+    def test_weights_before_registry(self):
+        for session in ["2023-02-01", "2023-01-01"]:
+            touch(self.directory, f"{session}_weights.h5")
+
+        versions = WeightsRegistry().versions()
+        self.assertEqual(
+            [v["file"] for v in versions],
+            ["2023-01-01_weights.h5", "2023-02-01_weights.h5"],
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "index.json")))
+
+    def test_empty_directory(self):
+        with self.assertRaises(FileNotFoundError):
+            WeightsRegistry().get()
+
+
+class LatestNormalizerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = temp_dirs(self, "WEIGHTS")["WEIGHTS"]
+
+    def test_paired_with_current_weights(self):
+        for session in ["2023-01-01", "2023-02-01"]:
+            touch(self.directory, f"{session}_weights.h5")
+            touch(self.directory, f"{session}_normalizer.json")
+
+        WeightsRegistry().pin(1)
+        self.assertEqual(
+            get_latest_normalizer(),
+            os.path.join(self.directory, "2023-01-01_normalizer.json"),
+        )
+
+    def test_version_without_normalizer(self):
+        touch(self.directory, "2023-01-01_weights.h5")
+        touch(self.directory, "2023-02-01_weights.h5")
+        touch(self.directory, "2023-02-01_normalizer.json")
+
+        WeightsRegistry().pin(1)
+        self.assertIsNone(get_latest_normalizer())
+
+    def test_without_weights(self):
+        touch(self.directory, "2023-01-01_normalizer.json")
+        touch(self.directory, "2023-02-01_normalizer.json")
+        self.assertEqual(
+            get_latest_normalizer(),
+            os.path.join(self.directory, "2023-02-01_normalizer.json"),
+        )
+
+
+class ModelCacheTest(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        cache = ModelCache(capacity=2)
+        cache.get("a", lambda: "A")
+        cache.get("b", lambda: "B")
+        cache.get("a", lambda: "reloaded")
+        cache.get("c", lambda: "C")
+
+        self.assertEqual(list(cache.models), ["a", "c"])
+        self.assertEqual(cache.get("a", lambda: "reloaded"), "A")
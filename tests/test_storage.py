@@ -0,0 +1,106 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from alstm_stock_market.src.app.app import App, save_changes
+from alstm_stock_market.src.app.storage import SQLiteStorage
+from tests import CALENDAR, temp_dirs
+
+
+class CountingStorage(SQLiteStorage):
+    def __init__(self):
+        super().__init__(":memory:")
+        self.requests = 0
+
+    def fetch(self, start, end):
+        self.requests += 1
+        return super().fetch(start, end)
+
+    def bulk_write(self, docs):
+        self.requests += 1
+        return super().bulk_write(docs)
+
+
+class SQLiteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = SQLiteStorage(":memory:")
+        self.addCleanup(self.storage.close)
+
+    def test_bulk_write_and_fetch_by_date(self):
+        statuses = self.storage.bulk_write(
+            [{"date": f"2023-01-0{day}", "pred_close": day} for day in range(1, 6)]
+        )
+        self.assertTrue(all(s["rev"].startswith("1-") for s in statuses))
+
+        docs = self.storage.fetch("2023-01-02", "2023-01-04")
+        self.assertEqual(list(docs), ["2023-01-02", "2023-01-03", "2023-01-04"])
+        self.assertEqual(docs["2023-01-03"]["pred_close"], 3)
+
+    def test_update_needs_current_revision(self):
+        (status,) = self.storage.bulk_write([{"date": "2023-01-02"}])
+        doc = {"date": "2023-01-02", "_id": status["id"], "_rev": status["rev"]}
+
+        (updated,) = self.storage.bulk_write([{**doc, "close": 1.0}])
+        self.assertTrue(updated["rev"].startswith("2-"))
+
+        (conflict,) = self.storage.bulk_write([{**doc, "close": 2.0}])
+        self.assertEqual(conflict["error"], "conflict")
+        self.assertEqual(
+            self.storage.fetch("2023-01-02", "2023-01-02")["2023-01-02"]["close"], 1.0
+        )
+
+
+class SaveChangesTest(unittest.TestCase):
+    def setUp(self):
+        temp_dirs(self, "LOGS")
+
+    def test_counts_only_written_docs(self):
+        storage = SQLiteStorage(":memory:")
+        (status,) = storage.bulk_write([{"date": "2023-01-02"}])
+        stale = {"date": "2023-01-02", "_id": status["id"], "_rev": "1-stale"}
+        changes = {"2023-01-02": stale, "2023-01-03": {"date": "2023-01-03"}}
+        messages = {date: f"Changed {date}" for date in changes}
+
+        self.assertEqual(save_changes(storage, changes, messages), 1)
+        self.assertIn("_rev", changes["2023-01-03"])
+        storage.close()
+
+
+class AppSyncTest(unittest.TestCase):
+    def setUp(self):
+        temp_dirs(self, "WEIGHTS", "LOGS", "CACHE")
+        environ = mock.patch.dict(
+            os.environ, {"CALENDAR": CALENDAR, "MAX_TRAINING_DATE": "2023-12-29"}
+        )
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def test_one_fetch_and_one_bulk_write(self):
+        dates = pd.bdate_range(end="2023-12-29", periods=51)
+        pred_date = dates[-1].strftime("%Y-%m-%d")
+        storage = CountingStorage()
+        storage.bulk_write(
+            [
+                {"date": d.strftime("%Y-%m-%d"), "pred_close": 1.0, "close": -1.0}
+                for d in dates[:-1]
+            ]
+        )
+        storage.requests = 0
+
+        app = App(pred_date, storage=storage)
+        app.interval_start = dates[0].strftime("%Y-%m-%d")
+        app.pred_close = 2.0
+        app.close_prices = pd.Series(np.arange(50, dtype=float), index=dates[:-1])
+        app._sync()
+
+        self.assertEqual(storage.requests, 2)
+        stored = storage.fetch(app.interval_start, pred_date)
+        self.assertEqual(
+            [doc["close"] for doc in stored.values() if "close" in doc],
+            list(app.close_prices),
+        )
+        self.assertEqual(stored[pred_date]["pred_close"], 2.0)
+        storage.close()
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+import pywt
+
+import alstm_stock_market.src.model.params as p
+from alstm_stock_market.bench import synthetic_data
+from alstm_stock_market.src.data.wavelet import (
+    StreamingDenoiser,
+    _denoise_last,
+    causal_wavelet_denoise,
+    wavelet_denoise,
+)
+
+
+def loop_denoise(values):
+    # One column at a time, as it was done before the batched transform
+    transformed = np.empty_like(values)
+    for col in range(values.shape[1]):
+        coeffs = pywt.wavedec(values[:, col], p.wavelet, p.wavelet_mode, level=p.levels)
+        n = len(coeffs[-1])
+        threshold = np.std(coeffs[-1]) * np.sqrt(2 * np.log(n))
+        for i, shrink in enumerate(p.shrink_coeffs):
+            if shrink:
+                coeffs[i] = pywt.threshold(coeffs[i], threshold, p.threshold_mode)
+        transformed[:, col] = pywt.waverec(coeffs, p.wavelet, p.wavelet_mode)[
+            : len(values)
+        ]
+    return transformed
+
+
+class WaveletDenoiseTest(unittest.TestCase):
+    def test_batched_matches_loop(self):
+        for rows in [100, 1001]:
+            values = synthetic_data(rows).to_numpy(dtype=np.float64)
+            np.testing.assert_allclose(wavelet_denoise(values), loop_denoise(values))
+
+    def test_axis(self):
+        values = np.stack(
+            [synthetic_data(300, seed).to_numpy(dtype=np.float64) for seed in range(3)]
+        )
+        denoised = wavelet_denoise(values, axis=1)
+        for series, expected in zip(values, denoised):
+            np.testing.assert_allclose(wavelet_denoise(series), expected)
+
+
+class CausalDenoiseTest(unittest.TestCase):
+    def setUp(self):
+        self.values = synthetic_data(700).to_numpy(dtype=np.float64)
+        self.denoised = causal_wavelet_denoise(self.values)
+
+    def test_rows_only_see_their_window(self):
+        for i in [0, 1, 50, p.causal_window - 2, p.causal_window - 1, 400, 699]:
+            history = self.values[max(0, i - p.causal_window + 1) : i + 1]
+            np.testing.assert_array_equal(self.denoised[i], _denoise_last(history))
+
+    def test_inputs_shorter_than_window(self):
+        for rows in [1, 2, p.causal_window - 1, p.causal_window, p.causal_window + 1]:
+            denoised = causal_wavelet_denoise(self.values[:rows])
+            np.testing.assert_array_equal(denoised, self.denoised[:rows])
+
+    def test_start_skips_earlier_rows(self):
+        for start in [0, 10, p.causal_window - 1, 500, 700]:
+            denoised = causal_wavelet_denoise(self.values, start=start)
+            np.testing.assert_array_equal(denoised, self.denoised[start:])
+
+
+class StreamingDenoiserTest(unittest.TestCase):
+    def setUp(self):
+        self.values = synthetic_data(400).to_numpy(dtype=np.float64)
+        self.denoised = causal_wavelet_denoise(self.values)
+
+    def test_push_matches_batch(self):
+        denoiser = StreamingDenoiser()
+        for i, bar in enumerate(self.values):
+            rows = denoiser.push(bar).rows
+            expected = self.denoised[max(0, i + 1 - p.time_step) : i + 1]
+            np.testing.assert_array_equal(rows, expected)
+
+    def test_extend_matches_batch(self):
+        denoiser = StreamingDenoiser().extend(self.values[:5])
+        np.testing.assert_array_equal(denoiser.rows, self.denoised[:5])
+
+        denoiser.extend(self.values[5:300]).extend(self.values[300:])
+        np.testing.assert_array_equal(denoiser.rows, self.denoised[-p.time_step :])
+        self.assertEqual(len(denoiser.raw), p.causal_window - 1)